@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AggregatorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "aggregator"
+
+    def ready(self):
+        from aggregator.scrapers import registry
+        registry.autodiscover()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from aggregator.scrapers.harness import SPIDER_FIXTURES, benchmark_parse
+
+
+class Command(BaseCommand):
+    help = "Benchmarks spider parse throughput against saved rate pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"spider":<16}{"pages/sec":>12}{"rows/sec":>12}')
+        for spider_class in SPIDER_FIXTURES:
+            result = benchmark_parse(spider_class, options['iterations'])
+            self.stdout.write(
+                f'{spider_class.name:<16}'
+                f'{result["pages_per_sec"]:>12.1f}'
+                f'{result["rows_per_sec"]:>12.1f}')
@@ -0,0 +1,136 @@
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from aggregator.services.collect_data import NOT_MODIFIED, CollectData
+from domain.models import Bank
+from domain.services.currencies import publish_snapshot
+from domain.services.events import publish_rate_changes
+
+
+def scrape(collector):
+    # Runs in a worker thread: network and parsing only, no DB access
+    scraped_data = collector.run_spider()
+    if scraped_data is NOT_MODIFIED:
+        return NOT_MODIFIED
+    return list(scraped_data) if scraped_data else []
+
+
+class Command(BaseCommand):
+    help = ("Scrapes every bank with a forex link concurrently and saves "
+            "the results in one transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Maximum number of concurrent scrapes')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Seconds each bank may take once its '
+                                 'scrape has started')
+        parser.add_argument('--skip-unchanged', action='store_true',
+                            help='Only write rates that changed')
+
+    def handle(self, *args, **options):
+        banks = (Bank.objects.exclude(forex_link__isnull=True)
+                 .exclude(forex_link=''))
+        collectors = [
+            CollectData(bank.name,
+                        skip_unchanged=options['skip_unchanged'],
+                        bank=bank)
+            for bank in banks
+        ]
+        if not collectors:
+            self.stdout.write(self.style.NOTICE('No banks to scrape'))
+            return
+
+        scraped = self.scrape_all(collectors, options['workers'],
+                                  options['timeout'])
+        results = [(collector, scraped[collector])
+                   for collector in collectors]
+
+        with transaction.atomic():
+            for collector, scraped_data in results:
+                if scraped_data is NOT_MODIFIED:
+                    collector.mark_not_modified()
+                    self.stdout.write(
+                        f'No changes for {collector.bank_name}')
+                    continue
+                if not scraped_data:
+                    collector.save_aggregator_log("failure")
+                    continue
+                try:
+                    success = collector.persist(scraped_data)
+                except Exception as e:
+                    # persist's own atomic block rolled back this bank only
+                    collector.changes = []
+                    collector.save_aggregator_log("failure")
+                    self.stdout.write(self.style.ERROR(
+                        f'Failed to save {collector.bank_name}: {e}'))
+                    continue
+                if success:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Collected {collector.bank_name}'))
+                else:
+                    self.stdout.write(self.style.NOTICE(
+                        f'Collected {collector.bank_name} with errors'))
+
+        publish_snapshot()
+        # Only after the commit, so subscribers never see rolled back rates
+        for collector in collectors:
+            publish_rate_changes(collector.changes)
+        self.stdout.write(self.style.SUCCESS('Rate collection completed!'))
+
+    def scrape_all(self, collectors, workers, timeout):
+        """
+        Scrape concurrently, giving each bank ``timeout`` seconds from
+        when its scrape starts. Threads cannot be interrupted, so banks
+        still queued behind hung scrapes are given up on once the whole
+        run has taken as long as every batch of ``workers`` banks using
+        its full budget.
+        """
+        started = {}
+
+        def run(collector):
+            started[collector] = time.monotonic()
+            return scrape(collector)
+
+        results = {}
+        deadline = time.monotonic() + timeout * math.ceil(
+            len(collectors) / workers)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = {executor.submit(run, collector): collector
+                       for collector in collectors}
+            while pending:
+                now = time.monotonic()
+                for future, collector in list(pending.items()):
+                    start = started.get(collector)
+                    if not future.done() and (now >= deadline or (
+                            start is not None and now - start >= timeout)):
+                        self.stdout.write(self.style.ERROR(
+                            f'Timed out scraping {collector.bank_name}'))
+                        results[collector] = []
+                        del pending[future]
+                if not pending:
+                    break
+
+                expires = [started[collector] + timeout
+                           for collector in pending.values()
+                           if collector in started]
+                done, _ = wait(pending,
+                               timeout=max(min([deadline, *expires]) - now,
+                                           0),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    collector = pending.pop(future)
+                    try:
+                        results[collector] = future.result()
+                    except Exception as e:
+                        self.stdout.write(self.style.ERROR(
+                            f'Error scraping {collector.bank_name}: {e}'))
+                        results[collector] = []
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from aggregator.services.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = ("Runs rate collection for every bank with a forex link at a "
+            "fixed interval until stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=900,
+                            help='Seconds between scrapes of each bank')
+        parser.add_argument('--jitter', type=float, default=60,
+                            help='Maximum random delay added per bank')
+        parser.add_argument('--max-backoff', type=float, default=6 * 3600,
+                            help='Longest delay after repeated failures')
+        parser.add_argument('--skip-unchanged', action='store_true',
+                            help='Only write rates that changed')
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler(
+            interval=options['interval'],
+            jitter=options['jitter'],
+            max_backoff=options['max_backoff'],
+            skip_unchanged=options['skip_unchanged'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Scheduler started, interval {options['interval']}s"))
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.NOTICE('Scheduler stopped'))
@@ -0,0 +1,42 @@
+import time
+from pathlib import Path
+
+from scrapy.http import HtmlResponse
+
+from aggregator.scrapers.spiders.ncba_spider import NCBASpider
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+# Saved rate page for each spider, replayed without network access
+SPIDER_FIXTURES = {
+    NCBASpider: 'ncba.html',
+}
+
+
+def load_fixture(spider_class, url=None):
+    """Return the spider's saved page as an HtmlResponse."""
+    body = (FIXTURES_DIR / SPIDER_FIXTURES[spider_class]).read_bytes()
+    url = url or spider_class.start_urls[0]
+    return HtmlResponse(url=url, body=body, encoding='utf-8')
+
+
+def parse_fixture(spider_class):
+    """Run the spider's parse over its saved page and return the rows."""
+    return list(spider_class().parse(load_fixture(spider_class)))
+
+
+def benchmark_parse(spider_class, iterations=200):
+    """Parse the saved page repeatedly and report pages/sec and rows/sec."""
+    spider = spider_class()
+    page = load_fixture(spider_class)
+    rows = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        # A fresh response each time so the parsed selector is not reused
+        response = page.replace(body=page.body)
+        rows += sum(1 for _ in spider.parse(response))
+    elapsed = time.perf_counter() - started
+    return {
+        'pages_per_sec': iterations / elapsed,
+        'rows_per_sec': rows / elapsed,
+    }
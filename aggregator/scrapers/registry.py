@@ -0,0 +1,35 @@
+import importlib
+import pkgutil
+
+import scrapy
+
+from aggregator.scrapers import spiders
+
+# Bank name -> spider class, filled once by AggregatorConfig.ready
+_registry = {}
+
+
+def register(spider_class):
+    _registry[spider_class.bank_name] = spider_class
+    return spider_class
+
+
+def autodiscover():
+    """Import every spider module and register spiders naming a bank."""
+    for module_info in pkgutil.iter_modules(spiders.__path__):
+        module = importlib.import_module(
+            f'{spiders.__name__}.{module_info.name}')
+        for value in vars(module).values():
+            if (isinstance(value, type)
+                    and issubclass(value, scrapy.Spider)
+                    and getattr(value, 'bank_name', None)):
+                register(value)
+
+
+def get_spider(bank_name):
+    return _registry.get(bank_name)
+
+
+def get_missing(bank_names):
+    """Bank names that have no registered spider."""
+    return [name for name in bank_names if name not in _registry]
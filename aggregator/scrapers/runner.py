@@ -0,0 +1,63 @@
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from scrapy.http import HtmlResponse
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide HTTP session so connections to bank sites are reused."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=settings.SCRAPER_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = settings.SCRAPER_USER_AGENT
+            _session = session
+    return _session
+
+
+def fetch(url, timeout=None, etag=None, last_modified=None):
+    """
+    GET ``url`` and wrap the body in a Scrapy HtmlResponse.
+
+    ``etag`` and ``last_modified`` from a previous fetch are sent as
+    If-None-Match / If-Modified-Since; None is returned on 304.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    response = get_session().get(
+        url, timeout=timeout or settings.SCRAPER_TIMEOUT, headers=headers)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    response_headers = {
+        name: response.headers[name]
+        for name in ('Content-Type', 'ETag', 'Last-Modified')
+        if name in response.headers
+    }
+    return HtmlResponse(
+        url=response.url,
+        status=response.status_code,
+        headers=response_headers,
+        body=response.content,
+    )
+
+
+def parse(spider_class, response):
+    """
+    Call the spider's parse on a fetched page directly, without starting
+    a Scrapy crawler or the Twisted reactor.
+    """
+    return list(spider_class().parse(response))
@@ -3,6 +3,7 @@ import scrapy
 
 class NCBASpider(scrapy.Spider):
     name = "ncba_bank"
+    bank_name = "NCBA"
     start_urls = ["https://ke.ncbagroup.com/forex-rates/"]
 
     def parse(self, response):
@@ -1,17 +1,37 @@
+import hashlib
 import logging
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
 from django.utils import timezone
-import importlib
+import requests
 
-from domain.models import Bank, Currency, Record, AggregatorLog
+from aggregator.scrapers import registry, runner
+from domain.models import Bank, Currency, Record, AggregatorLog, LatestRate
+from domain.services.currencies import publish_snapshot
+from domain.services.events import publish_rate_changes
+from domain.services.rollups import update_rollups
 
 logger = logging.getLogger(__name__)
 
+# Returned by run_spider when the bank's page has not changed
+NOT_MODIFIED = object()
+
+# Record.value holds 10 digits, 2 of them decimal places
+MAX_VALUE = Decimal('99999999.99')
+
 
 class CollectData:
-    def __init__(self, bank_name):
-        self.bank_name_lower = self.bank_name.lower()
-        self.module_name = f'aggregator.scrapers.spiders.{self.bank_name_lower}_spider'# noqa
-        self.class_name = f'{self.bank_name.capitalize()}Spider'
+    def __init__(self, bank_name, skip_unchanged=False, bank=None):
+        self.bank_name = bank_name
+        # Only write records whose value differs from the latest one
+        self.skip_unchanged = skip_unchanged
+        # Callers that already loaded the bank can pass it in
+        self.bank = bank or self.get_bank()
+        self.spider_class = registry.get_spider(self.bank_name)
+        # Validators of the last fetched page, saved along with its rates
+        self.fetch_state = {}
+        # Rates whose value changed in the last persisted scrape
+        self.changes = []
 
     def get_bank(self):
         # Retrieve the bank by name, return None if it doesn't exist
@@ -22,40 +42,142 @@ class CollectData:
             return None
 
     def run_spider(self):
-        try:
-            # Dynamically import the module
-            spider_module = importlib.import_module(self.module_name)
-            # Get the spider class dynamically
-            spider_class = getattr(spider_module, self.class_name)
-            # Instantiate the spider class and call start_requests
-            return spider_class().start_requests()
-        except ModuleNotFoundError:
-            logger.error(f"No spider module found for bank: {self.bank_name}")
-        except AttributeError:
-            logger.error(
-                f"Spider class '{self.class_name}' not found in module: {self.module_name}") # noqa
-        return None
+        if self.spider_class is None:
+            logger.error(f"No spider registered for bank: {self.bank_name}")
+            return None
 
-    def save_record(self, currency_code, buy_value, sell_value):
+        # Fetch the rates page once and parse it in-process
+        url = self.bank.forex_link or self.spider_class.start_urls[0]
         try:
-            currency = Currency.objects.get(short_name=currency_code)
-            Record.objects.create(
-                bank=self.bank,
-                currency=currency,
-                type="buy",
-                value=buy_value
-            )
-            Record.objects.create(
-                bank=self.bank,
-                currency=currency,
-                type="sell",
-                value=sell_value
+            response = runner.fetch(
+                url,
+                etag=self.bank.fetch_etag,
+                last_modified=self.bank.fetch_last_modified
             )
-            return True
-        except Currency.DoesNotExist:
-            logger.error(
-                f"Currency '{currency_code}' does not exist")
-            return False
+        except requests.RequestException as e:
+            logger.error(f"Failed to fetch {url} for {self.bank_name}: {e}")
+            return None
+
+        if response is None:
+            logger.info(f"Rates page not modified for: {self.bank_name}")
+            return NOT_MODIFIED
+
+        content_hash = hashlib.sha256(response.body).hexdigest()
+        self.fetch_state = {
+            "fetch_etag": self.get_header(response, "ETag"),
+            "fetch_last_modified": self.get_header(response, "Last-Modified"),
+            "fetch_content_hash": content_hash,
+        }
+        if content_hash == self.bank.fetch_content_hash:
+            logger.info(f"Rates page unchanged for: {self.bank_name}")
+            return NOT_MODIFIED
+
+        return runner.parse(self.spider_class, response)
+
+    def get_header(self, response, name):
+        value = response.headers.get(name)
+        return value.decode("latin-1") if value else None
+
+    def get_currency_map(self):
+        # One query for every currency a scrape can reference
+        return {currency.short_name: currency
+                for currency in Currency.objects.all()}
+
+    def build_records(self, scraped_data, currencies):
+        # Turn scraped rows into unsaved buy/sell records
+        records = []
+        all_success = True
+        for data in scraped_data:
+            currency_code = data.get("currency")
+            currency = currencies.get(currency_code)
+            if currency is None:
+                logger.error(
+                    f"Currency '{currency_code}' does not exist")
+                all_success = False
+                continue
+
+            values = {type: self.parse_value(data.get(type))
+                      for type in ("buy", "sell")}
+            if None in values.values():
+                logger.error(
+                    f"Invalid rates for '{currency_code}': "
+                    f"buy={data.get('buy')!r}, sell={data.get('sell')!r}")
+                all_success = False
+                continue
+
+            for type, value in values.items():
+                records.append(Record(
+                    bank=self.bank,
+                    currency=currency,
+                    type=type,
+                    value=value
+                ))
+        return records, all_success
+
+    def parse_value(self, value):
+        # A positive Decimal that fits Record.value, otherwise None
+        try:
+            value = Decimal(str(value).strip())
+        except InvalidOperation:
+            return None
+        if not value.is_finite() or not 0 < value <= MAX_VALUE:
+            return None
+        return value
+
+    def get_latest_values(self):
+        # Current value per (currency, type) for this bank
+        return {
+            (rate.currency_id, rate.type): rate.value
+            for rate in LatestRate.objects.filter(bank=self.bank)
+        }
+
+    def drop_unchanged(self, records, latest_values):
+        return [
+            record for record in records
+            if latest_values.get((record.currency_id, record.type))
+            != Decimal(str(record.value))
+        ]
+
+    def get_changes(self, records, latest_values):
+        # Compact deltas for the rate change stream
+        changes = []
+        for record in records:
+            old = latest_values.get((record.currency_id, record.type))
+            new = Decimal(str(record.value))
+            if old == new:
+                continue
+            changes.append({
+                "bank": self.bank.id,
+                "currency": record.currency.short_name,
+                "type": record.type,
+                "old": None if old is None else str(old),
+                "new": str(new),
+                "timestamp": record.created_at.isoformat(),
+            })
+        return changes
+
+    def save_records(self, records):
+        Record.objects.bulk_create(records)
+        self.update_latest_rates(records)
+        update_rollups(records)
+
+    def update_latest_rates(self, records):
+        # Keep the materialized current value in step with Record
+        LatestRate.objects.bulk_create(
+            [
+                LatestRate(
+                    bank=record.bank,
+                    currency=record.currency,
+                    type=record.type,
+                    record=record,
+                    value=record.value
+                )
+                for record in records
+            ],
+            update_conflicts=True,
+            unique_fields=["bank", "currency", "type"],
+            update_fields=["record", "value", "updated_at"]
+        )
 
     def save_aggregator_log(self, status):
         AggregatorLog.objects.create(
@@ -65,8 +187,44 @@ class CollectData:
         )
 
     def update_last_checked(self):
+        # Saved with the records so a failed run is fetched again in full
+        for field, value in self.fetch_state.items():
+            setattr(self.bank, field, value)
         self.bank.last_checked = timezone.now()
-        self.bank.save()
+        self.bank.save(update_fields=[
+            "last_checked", "updated_at", *self.fetch_state])
+
+    def mark_not_modified(self):
+        # Nothing to parse or store; record that the bank was checked and
+        # answered, which also ends the scheduler's failure streak
+        self.bank.last_checked = timezone.now()
+        with transaction.atomic():
+            Bank.objects.filter(pk=self.bank.pk).update(
+                last_checked=self.bank.last_checked, **self.fetch_state)
+            self.save_aggregator_log("success")
+
+    def persist(self, scraped_data):
+        # Write one scrape as a single all-or-nothing transaction
+        currencies = self.get_currency_map()
+        records, all_success = self.build_records(scraped_data, currencies)
+
+        with transaction.atomic():
+            latest_values = self.get_latest_values()
+            if self.skip_unchanged:
+                records = self.drop_unchanged(records, latest_values)
+            self.save_records(records)
+            self.changes = self.get_changes(records, latest_values)
+            # Log the outcome
+            if all_success:
+                self.save_aggregator_log("success")
+            else:
+                self.save_aggregator_log("failure")
+            # A partly rejected page must be fetched and parsed again
+            if not all_success:
+                self.fetch_state = dict.fromkeys(self.fetch_state)
+            # Update the last_checked timestamp
+            self.update_last_checked()
+        return all_success
 
     def process_data(self):
         # Make sure the bank exists
@@ -77,27 +235,16 @@ class CollectData:
 
         # Run the spider to get the data
         scraped_data = self.run_spider()
+        if scraped_data is NOT_MODIFIED:
+            self.mark_not_modified()
+            return
         if not scraped_data:
             logger.error(f"Scraping failed for bank: {self.bank_name}")
             self.save_aggregator_log("failure")
             return
 
-        # Process each row of scraped data
-        all_success = True
-        for data in scraped_data:
-            currency = data.get("currency")
-            buy = data.get("buy")
-            sell = data.get("sell")
-
-            # Save the records to the database
-            success = self.save_record(currency, buy, sell)
-            if not success:
-                all_success = False
-        # Log the outcome
-        if all_success:
-            self.save_aggregator_log("success")
-        else:
-            self.save_aggregator_log("failure")
+        self.persist(scraped_data)
 
-        # Update the last_checked timestamp
-        self.update_last_checked()
+        # Render the currencies endpoint once for all readers
+        publish_snapshot()
+        publish_rate_changes(self.changes)
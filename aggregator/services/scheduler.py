@@ -0,0 +1,100 @@
+import logging
+import random
+import time
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from aggregator.services.collect_data import CollectData
+from domain.models import Bank
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    Triggers CollectData for each bank on its own staggered timer.
+
+    Banks are scheduled ``interval`` seconds apart plus up to ``jitter``
+    seconds of random delay. Consecutive failures recorded in
+    AggregatorLog double the interval, capped at ``max_backoff``, and a
+    bank whose ``last_checked`` is more recent than ``interval`` (for
+    example after a manual ``collect_rates``) is pushed back instead of
+    scraped again.
+    """
+
+    def __init__(self, interval, jitter=0, max_backoff=None,
+                 skip_unchanged=False, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff or interval
+        self.skip_unchanged = skip_unchanged
+        self.clock = clock
+        self.sleep = sleep
+        self.next_run = {}
+
+    def get_banks(self):
+        # Reloaded every tick so new banks are picked up without restart
+        return list(Bank.objects.exclude(forex_link__isnull=True)
+                    .exclude(forex_link=''))
+
+    def get_failure_streak(self, bank):
+        # Number of failures since the bank's last successful run
+        statuses = (bank.logs.order_by('-id')
+                    .values_list('status', flat=True)[:32])
+        streak = 0
+        for status in statuses:
+            if status != 'failure':
+                break
+            streak += 1
+        return streak
+
+    def get_delay(self, failures):
+        delay = min(self.interval * 2 ** failures, self.max_backoff)
+        return delay + random.uniform(0, self.jitter)
+
+    def get_age(self, bank):
+        # Seconds since the bank was last checked, None if never
+        if bank.last_checked is None:
+            return None
+        return (timezone.now() - bank.last_checked).total_seconds()
+
+    def collect(self, bank):
+        try:
+            CollectData(bank.name, skip_unchanged=self.skip_unchanged,
+                        bank=bank).process_data()
+        except Exception:
+            logger.exception(f"Scheduled collection failed for: {bank.name}")
+
+    def run_pending(self):
+        """Collect every bank that is due and return the next due time."""
+        now = self.clock()
+        banks = self.get_banks()
+        # Forget banks that were deleted or lost their forex link
+        bank_ids = {bank.id for bank in banks}
+        for bank_id in set(self.next_run) - bank_ids:
+            del self.next_run[bank_id]
+
+        for bank in banks:
+            due = self.next_run.setdefault(
+                bank.id, now + random.uniform(0, self.jitter))
+            if due > now:
+                continue
+
+            age = self.get_age(bank)
+            if age is not None and age < self.interval:
+                self.next_run[bank.id] = (now + self.interval - age
+                                          + random.uniform(0, self.jitter))
+                continue
+
+            self.collect(bank)
+            failures = self.get_failure_streak(bank)
+            self.next_run[bank.id] = self.clock() + self.get_delay(failures)
+        return min(self.next_run.values(), default=now + self.interval)
+
+    def run_forever(self):
+        while True:
+            close_old_connections()
+            next_due = self.run_pending()
+            self.sleep(max(next_due - self.clock(), 1))
@@ -0,0 +1,539 @@
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from domain.models import (
+    AggregatorLog,
+    Bank,
+    Currency,
+    LatestRate,
+    Record,
+    RecordDaily,
+    RecordHourly,
+)
+from .scrapers import registry, runner
+from .scrapers.harness import (
+    SPIDER_FIXTURES,
+    benchmark_parse,
+    load_fixture,
+    parse_fixture,
+)
+from .scrapers.spiders.ncba_spider import NCBASpider
+from .services.collect_data import NOT_MODIFIED, CollectData
+from .services.scheduler import Scheduler
+
+
+def fake_session(status_code=200, headers=None):
+    # Stands in for the pooled session, serving the saved NCBA page
+    page = load_fixture(NCBASpider)
+    response = mock.Mock(
+        url=page.url,
+        status_code=status_code,
+        headers={'Content-Type': 'text/html; charset=utf-8',
+                 **(headers or {})},
+        content=page.body,
+    )
+    if status_code >= 400:
+        response.raise_for_status.side_effect = (
+            runner.requests.HTTPError(status_code))
+    session = mock.Mock()
+    session.get.return_value = response
+    return session
+
+
+class CollectDataTestMixin:
+    def setUp(self):
+        self.bank = Bank.objects.create(name='NCBA', logo='ncba.png')
+        self.currencies = [
+            Currency.objects.create(name=f'Currency {index}',
+                                    country=f'Country {index}',
+                                    short_name=f'C{index:02d}')
+            for index in range(20)
+        ]
+
+    def scraped_rows(self, count, buy='128.00', sell='131.00'):
+        return [
+            {'currency': currency.short_name, 'buy': buy, 'sell': sell}
+            for currency in self.currencies[:count]
+        ]
+
+
+class PersistTests(CollectDataTestMixin, TestCase):
+    def test_saves_records_latest_rates_log_and_last_checked(self):
+        collector = CollectData('NCBA')
+
+        self.assertTrue(collector.persist(self.scraped_rows(2)))
+        self.assertTrue(collector.persist(
+            self.scraped_rows(2, buy='129.50', sell='132.25')))
+
+        self.assertEqual(Record.objects.count(), 8)
+        self.assertEqual(LatestRate.objects.count(), 4)
+        rate = LatestRate.objects.get(currency=self.currencies[0],
+                                      type='buy')
+        self.assertEqual(str(rate.value), '129.50')
+        self.assertEqual(rate.record,
+                         Record.objects.filter(currency=self.currencies[0],
+                                               type='buy').last())
+        self.assertEqual(
+            list(AggregatorLog.objects.values_list('type', 'status')),
+            [('scrape', 'success'), ('scrape', 'success')])
+        self.bank.refresh_from_db()
+        self.assertIsNotNone(self.bank.last_checked)
+
+    def test_unknown_currency_is_skipped_and_logged_as_failure(self):
+        collector = CollectData('NCBA')
+        rows = self.scraped_rows(1) + [
+            {'currency': 'XXX', 'buy': '1.00', 'sell': '2.00'}]
+
+        self.assertFalse(collector.persist(rows))
+
+        self.assertEqual(Record.objects.count(), 2)
+        self.assertEqual(AggregatorLog.objects.get().status, 'failure')
+
+    def test_unparseable_values_are_skipped_and_logged_as_failure(self):
+        for skip_unchanged in (False, True):
+            collector = CollectData('NCBA', skip_unchanged=skip_unchanged)
+            rows = self.scraped_rows(1) + [
+                {'currency': currency.short_name, 'buy': buy, 'sell': '2.00'}
+                for currency, buy in zip(
+                    self.currencies[1:],
+                    ['', '-', '1,234.50', None, 'NaN', '0', '-1.00',
+                     '1e10'])]
+
+            with self.subTest(skip_unchanged=skip_unchanged):
+                self.assertFalse(collector.persist(rows))
+
+        self.assertEqual(
+            set(Record.objects.values_list('currency', flat=True)),
+            {self.currencies[0].id})
+        self.assertEqual(
+            list(AggregatorLog.objects.values_list('status', flat=True)),
+            ['failure', 'failure'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        collector = CollectData('NCBA')
+
+        with CaptureQueriesContext(connection) as small:
+            collector.persist(self.scraped_rows(2))
+        with CaptureQueriesContext(connection) as large:
+            collector.persist(self.scraped_rows(20))
+
+        self.assertEqual(len(small), len(large))
+
+    def test_updates_hourly_and_daily_rollups(self):
+        collector = CollectData('NCBA')
+        collector.persist(self.scraped_rows(1, buy='128.00'))
+        collector.persist(self.scraped_rows(1, buy='126.50'))
+        collector.persist(self.scraped_rows(1, buy='127.25'))
+
+        for model in (RecordHourly, RecordDaily):
+            rollups = list(model.objects.filter(type='buy').values_list(
+                'open', 'high', 'low', 'close', 'count'))
+            self.assertEqual([tuple(map(str, rollup[:4])) + rollup[4:]
+                              for rollup in rollups],
+                             [('128.00', '128.00', '126.50', '127.25', 3)])
+
+        incremental = list(RecordHourly.objects.values_list(
+            'bucket', 'open', 'high', 'low', 'close', 'count'))
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(list(RecordHourly.objects.values_list(
+            'bucket', 'open', 'high', 'low', 'close', 'count')), incremental)
+
+    def test_records_changed_rates_for_the_event_stream(self):
+        collector = CollectData('NCBA')
+        collector.persist(self.scraped_rows(1))
+        self.assertEqual([(change['type'], change['old'], change['new'])
+                          for change in collector.changes],
+                         [('buy', None, '128.00'), ('sell', None, '131.00')])
+
+        collector.persist(self.scraped_rows(1, buy='129.5'))
+
+        change, = collector.changes
+        self.assertEqual(change['bank'], self.bank.id)
+        self.assertEqual(change['currency'], 'C00')
+        self.assertEqual((change['old'], change['new']), ('128.00', '129.5'))
+
+    def test_failure_rolls_back_the_whole_run(self):
+        collector = CollectData('NCBA')
+
+        with mock.patch.object(CollectData, 'update_last_checked',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                collector.persist(self.scraped_rows(2))
+
+        self.assertFalse(Record.objects.exists())
+        self.assertFalse(LatestRate.objects.exists())
+        self.assertFalse(AggregatorLog.objects.exists())
+
+
+class SkipUnchangedTests(CollectDataTestMixin, TestCase):
+    def test_only_changed_values_are_written(self):
+        collector = CollectData('NCBA', skip_unchanged=True)
+        collector.persist(self.scraped_rows(2))
+        first_record = Record.objects.last()
+
+        rows = self.scraped_rows(2)
+        rows[0]['buy'] = '129.5'
+        rows[1]['sell'] = '131'
+        collector.persist(rows)
+
+        self.assertEqual(Record.objects.count(), 5)
+        new_record = Record.objects.last()
+        self.assertEqual(new_record.currency, self.currencies[0])
+        self.assertEqual(new_record.type, 'buy')
+        self.assertGreater(new_record.id, first_record.id)
+        rate = LatestRate.objects.get(currency=self.currencies[0],
+                                      type='buy')
+        self.assertEqual(rate.record, new_record)
+
+    def test_unchanged_run_still_updates_last_checked(self):
+        collector = CollectData('NCBA', skip_unchanged=True)
+        collector.persist(self.scraped_rows(2))
+        self.bank.refresh_from_db()
+        first_checked = self.bank.last_checked
+
+        collector.persist(self.scraped_rows(2))
+
+        self.assertEqual(Record.objects.count(), 4)
+        self.assertEqual(AggregatorLog.objects.count(), 2)
+        self.bank.refresh_from_db()
+        self.assertGreater(self.bank.last_checked, first_checked)
+
+    def test_default_mode_writes_every_value(self):
+        collector = CollectData('NCBA')
+        collector.persist(self.scraped_rows(2))
+        collector.persist(self.scraped_rows(2))
+
+        self.assertEqual(Record.objects.count(), 8)
+
+
+class CollectRatesCommandTests(CollectDataTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bank.forex_link = 'https://ncba.example/forex/'
+        self.bank.save()
+        Bank.objects.create(name='Slow', logo='slow.png',
+                            forex_link='https://slow.example/forex/')
+        Bank.objects.create(name='Offline', logo='offline.png')
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def fake_run_spider(self, collector):
+        if collector.bank_name.startswith('Slow'):
+            self.release.wait(5)
+            return []
+        if collector.bank_name.startswith('Queued'):
+            time.sleep(0.15)
+        return self.scraped_rows(2)
+
+    def collect(self, **options):
+        with mock.patch.object(CollectData, 'run_spider', autospec=True,
+                               side_effect=self.fake_run_spider):
+            call_command('collect_rates', stdout=StringIO(), **options)
+
+    def test_scrapes_banks_with_forex_link_and_times_out_slow_ones(self):
+        with mock.patch.object(CollectData, 'run_spider', autospec=True,
+                               side_effect=self.fake_run_spider):
+            call_command('collect_rates', timeout=0.2, stdout=StringIO())
+
+        self.assertEqual(Record.objects.filter(bank=self.bank).count(), 4)
+        self.assertEqual(
+            AggregatorLog.objects.get(bank=self.bank).status, 'success')
+        self.assertEqual(
+            AggregatorLog.objects.get(bank__name='Slow').status, 'failure')
+        self.assertFalse(
+            AggregatorLog.objects.filter(bank__name='Offline').exists())
+
+    def test_publishes_rate_changes_of_each_bank(self):
+        with mock.patch('aggregator.management.commands.collect_rates'
+                        '.publish_rate_changes') as publish:
+            self.collect(timeout=0.2)
+
+        changes, = [call.args[0] for call in publish.call_args_list
+                    if call.args[0]]
+        self.assertEqual(len(changes), 4)
+        self.assertEqual({change['bank'] for change in changes},
+                         {self.bank.id})
+
+    def test_failing_bank_does_not_roll_back_the_others(self):
+        Bank.objects.filter(name='Slow').delete()
+        Bank.objects.create(name='Broken', logo='broken.png',
+                            forex_link='https://broken.example/')
+        save_records = CollectData.save_records
+
+        def fake_save_records(collector, records):
+            save_records(collector, records)
+            if collector.bank_name == 'Broken':
+                raise IntegrityError('broken row')
+
+        with mock.patch.object(CollectData, 'save_records', autospec=True,
+                               side_effect=fake_save_records), \
+                mock.patch('aggregator.management.commands.collect_rates'
+                           '.publish_rate_changes') as publish:
+            self.collect(timeout=0.2)
+
+        self.assertEqual(Record.objects.filter(bank=self.bank).count(), 4)
+        self.assertFalse(
+            Record.objects.filter(bank__name='Broken').exists())
+        self.assertEqual(
+            AggregatorLog.objects.get(bank__name='Broken').status,
+            'failure')
+        changes, = [call.args[0] for call in publish.call_args_list
+                    if call.args[0]]
+        self.assertEqual({change['bank'] for change in changes},
+                         {self.bank.id})
+
+    def test_timeout_runs_from_each_scrape_start(self):
+        Bank.objects.filter(name='Slow').delete()
+        for name in ('Queued 1', 'Queued 2'):
+            Bank.objects.create(name=name, logo='queued.png',
+                                forex_link='https://queued.example/')
+
+        self.collect(workers=1, timeout=0.25)
+
+        self.assertEqual(
+            set(AggregatorLog.objects.values_list('status', flat=True)),
+            {'success'})
+
+    def test_hung_banks_share_one_deadline(self):
+        for index in range(2, 5):
+            Bank.objects.create(name=f'Slow {index}', logo='slow.png',
+                                forex_link='https://slow.example/')
+
+        started = time.monotonic()
+        self.collect(workers=5, timeout=0.3)
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(AggregatorLog.objects.filter(
+            bank__name__startswith='Slow', status='failure').count(), 4)
+
+
+class SchedulerTests(CollectDataTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bank.forex_link = 'https://ncba.example/forex/'
+        self.bank.save()
+        self.now = 1000.0
+        self.scheduler = Scheduler(interval=60, max_backoff=600,
+                                   clock=lambda: self.now)
+
+    def log_failures(self, count):
+        for _ in range(count):
+            AggregatorLog.objects.create(bank=self.bank, type='scrape',
+                                         status='failure')
+
+    def test_backs_off_exponentially_up_to_the_cap(self):
+        self.assertEqual(self.scheduler.get_delay(0), 60)
+        self.assertEqual(self.scheduler.get_delay(2), 240)
+        self.assertEqual(self.scheduler.get_delay(10), 600)
+
+    def test_failure_streak_stops_at_last_success(self):
+        self.log_failures(2)
+        AggregatorLog.objects.create(bank=self.bank, type='scrape',
+                                     status='success')
+        self.log_failures(3)
+
+        self.assertEqual(self.scheduler.get_failure_streak(self.bank), 3)
+
+    @mock.patch.object(CollectData, 'process_data', autospec=True)
+    def test_collects_due_bank_and_schedules_backoff(self, process_data):
+        process_data.side_effect = lambda collector: self.log_failures(1)
+
+        next_due = self.scheduler.run_pending()
+
+        process_data.assert_called_once()
+        self.assertEqual(next_due, self.now + 120)
+
+    @mock.patch.object(CollectData, 'run_spider', autospec=True,
+                       return_value=NOT_MODIFIED)
+    def test_not_modified_page_ends_failure_streak(self, run_spider):
+        self.log_failures(2)
+
+        next_due = self.scheduler.run_pending()
+
+        run_spider.assert_called_once()
+        self.assertEqual(self.scheduler.get_failure_streak(self.bank), 0)
+        self.assertEqual(next_due, self.now + 60)
+
+    @mock.patch.object(CollectData, 'process_data', autospec=True)
+    def test_skips_recently_checked_bank(self, process_data):
+        self.bank.last_checked = timezone.now() - timedelta(seconds=20)
+        self.bank.save()
+
+        next_due = self.scheduler.run_pending()
+
+        process_data.assert_not_called()
+        self.assertAlmostEqual(next_due, self.now + 40, delta=1)
+
+    @mock.patch.object(CollectData, 'process_data', autospec=True)
+    def test_forgets_banks_that_are_no_longer_scheduled(self, process_data):
+        # Due in the past when its forex link was removed
+        other = Bank.objects.create(name='Other', logo='other.png')
+        self.scheduler.next_run[other.id] = self.now - 60
+
+        next_due = self.scheduler.run_pending()
+
+        self.assertNotIn(other.id, self.scheduler.next_run)
+        self.assertGreater(next_due, self.now)
+
+
+class SpiderParseTests(TestCase):
+    def test_ncba_parses_every_rate_row(self):
+        rows = parse_fixture(NCBASpider)
+
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0], {'currency': 'USD',
+                                   'buy': '128.40', 'sell': '131.60'})
+        self.assertEqual(rows[-1], {'currency': 'SSP',
+                                    'buy': '0.02', 'sell': '0.03'})
+
+    def test_every_spider_yields_complete_rows(self):
+        for spider_class in SPIDER_FIXTURES:
+            with self.subTest(spider=spider_class.name):
+                rows = parse_fixture(spider_class)
+                self.assertTrue(rows)
+                for row in rows:
+                    self.assertTrue(all(row.values()), row)
+
+    def test_benchmark_reports_throughput(self):
+        result = benchmark_parse(NCBASpider, iterations=5)
+
+        self.assertGreater(result['pages_per_sec'], 0)
+        self.assertAlmostEqual(result['rows_per_sec'],
+                               result['pages_per_sec'] * 20)
+
+
+class RunnerTests(TestCase):
+    def test_fetches_once_and_parses_in_process(self):
+        session = fake_session()
+        with mock.patch.object(runner, 'get_session', return_value=session):
+            response = runner.fetch('https://ke.ncbagroup.com/forex-rates/')
+        rows = runner.parse(NCBASpider, response)
+
+        session.get.assert_called_once_with(
+            'https://ke.ncbagroup.com/forex-rates/', timeout=30, headers={})
+        self.assertEqual(rows, parse_fixture(NCBASpider))
+
+    def test_http_errors_are_raised(self):
+        session = fake_session(status_code=503)
+        with mock.patch.object(runner, 'get_session', return_value=session):
+            with self.assertRaises(runner.requests.HTTPError):
+                runner.fetch('https://ke.ncbagroup.com/forex-rates/')
+
+    def test_not_modified_returns_none(self):
+        session = fake_session(status_code=304)
+        with mock.patch.object(runner, 'get_session', return_value=session):
+            response = runner.fetch('https://ke.ncbagroup.com/forex-rates/',
+                                    etag='"abc"',
+                                    last_modified='Sun, 18 Oct 2026 '
+                                                  '09:00:00 GMT')
+
+        self.assertIsNone(response)
+        session.get.assert_called_once_with(
+            'https://ke.ncbagroup.com/forex-rates/', timeout=30,
+            headers={'If-None-Match': '"abc"',
+                     'If-Modified-Since': 'Sun, 18 Oct 2026 09:00:00 GMT'})
+
+    def test_session_is_shared(self):
+        self.assertIs(runner.get_session(), runner.get_session())
+
+
+class RegistryTests(TestCase):
+    def test_resolves_spider_by_bank_name(self):
+        self.assertIs(registry.get_spider('NCBA'), NCBASpider)
+        self.assertIsNone(registry.get_spider('Unknown'))
+
+    def test_every_seeded_bank_has_a_spider(self):
+        call_command('seed', stdout=StringIO())
+
+        bank_names = Bank.objects.values_list('name', flat=True)
+        self.assertEqual(registry.get_missing(bank_names), [])
+
+    def test_process_data_uses_registered_spider(self):
+        call_command('seed', stdout=StringIO())
+        session = fake_session()
+
+        with mock.patch.object(runner, 'get_session', return_value=session):
+            CollectData('NCBA').process_data()
+
+        self.assertEqual(Record.objects.count(), 40)
+        self.assertEqual(AggregatorLog.objects.get().status, 'success')
+
+    def test_process_data_publishes_rate_changes(self):
+        call_command('seed', stdout=StringIO())
+
+        with mock.patch.object(runner, 'get_session',
+                               return_value=fake_session()), \
+                mock.patch('aggregator.services.collect_data'
+                           '.publish_rate_changes') as publish:
+            CollectData('NCBA').process_data()
+
+        changes, = publish.call_args.args
+        self.assertEqual(len(changes), 40)
+
+
+class ConditionalFetchTests(TestCase):
+    def setUp(self):
+        call_command('seed', stdout=StringIO())
+
+    def collect(self, session):
+        with mock.patch.object(runner, 'get_session', return_value=session):
+            CollectData('NCBA').process_data()
+
+    def test_saves_validators_and_sends_them_next_time(self):
+        self.collect(fake_session(headers={'ETag': '"v1"'}))
+        bank = Bank.objects.get(name='NCBA')
+        self.assertEqual(bank.fetch_etag, '"v1"')
+        self.assertEqual(len(bank.fetch_content_hash), 64)
+
+        session = fake_session(status_code=304)
+        self.collect(session)
+
+        self.assertEqual(
+            session.get.call_args.kwargs['headers'],
+            {'If-None-Match': '"v1"'})
+        self.assertEqual(Record.objects.count(), 40)
+        self.assertEqual(
+            list(AggregatorLog.objects.values_list('status', flat=True)),
+            ['success', 'success'])
+        bank_after = Bank.objects.get(name='NCBA')
+        self.assertGreater(bank_after.last_checked, bank.last_checked)
+
+    def test_page_with_rejected_rows_is_parsed_again(self):
+        usd = Currency.objects.get(short_name='USD')
+        currency_fields = {'name': usd.name, 'country': usd.country,
+                           'short_name': 'USD'}
+        usd.delete()
+        self.collect(fake_session(headers={'ETag': '"v1"'}))
+        bank = Bank.objects.get(name='NCBA')
+        self.assertIsNone(bank.fetch_content_hash)
+        self.assertIsNone(bank.fetch_etag)
+
+        Currency.objects.create(**currency_fields)
+        self.collect(fake_session(headers={'ETag': '"v1"'}))
+
+        self.assertTrue(Record.objects.filter(
+            currency__short_name='USD').exists())
+        self.assertEqual(
+            list(AggregatorLog.objects.values_list('status', flat=True)),
+            ['failure', 'success'])
+
+    def test_identical_page_is_not_parsed_or_stored(self):
+        self.collect(fake_session())
+
+        with mock.patch.object(runner, 'parse') as parse:
+            self.collect(fake_session())
+
+        parse.assert_not_called()
+        self.assertEqual(Record.objects.count(), 40)
+        self.assertEqual(AggregatorLog.objects.count(), 2)
@@ -0,0 +1,89 @@
+import json
+from decimal import Decimal
+
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder with Decimals kept exact as strings."""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def encode_default(obj):
+    # Types the fast encoders do not know (lazy strings, sets, timedelta,
+    # ...) are converted the way DRF's JSONRenderer converts them
+    return _encoder.default(obj)
+
+
+# Compact UTF-8 JSON from the fastest installed encoder. Decimals become
+# strings and aware datetimes ISO 8601 strings ending in Z for UTC with
+# every backend; only the stdlib one truncates them to milliseconds.
+# Integers beyond 64 bits, which the fast encoders reject, are left to
+# the stdlib encoder.
+if orjson is not None:
+    JSON_BACKEND = 'orjson'
+
+    def dumps(data):
+        try:
+            return orjson.dumps(
+                data, default=encode_default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            return stdlib_dumps(data)
+elif msgspec is not None:
+    JSON_BACKEND = 'msgspec'
+    _msgspec_encode = msgspec.json.Encoder(enc_hook=encode_default,
+                                           decimal_format='string').encode
+
+    def dumps(data):
+        try:
+            return _msgspec_encode(data)
+        except (TypeError, OverflowError):
+            return stdlib_dumps(data)
+else:
+    JSON_BACKEND = 'json'
+    dumps = stdlib_dumps
+
+
+class FastJSONRenderer(BaseRenderer):
+    """DRF renderer using ``dumps`` instead of the stdlib encoder."""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse counterpart for plain views, rendered with ``dumps``."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Bank, Currency, AggregatorLog, Record
+from .models import (
+    Bank,
+    Currency,
+    AggregatorLog,
+    Record,
+    LatestRate,
+    RecordHourly,
+    RecordDaily,
+)
 from unfold.admin import ModelAdmin
 
 
@@ -34,3 +42,18 @@ class RecordAdmin(ModelAdmin):
     list_display = ('bank', 'currency', 'type', 'value', 'created_at')
     search_fields = ('bank__name', 'currency__short_name', 'type')
     list_filter = ('type', 'bank', 'currency', 'created_at')
+
+
+@admin.register(LatestRate)
+class LatestRateAdmin(ModelAdmin):
+    list_display = ('bank', 'currency', 'type', 'value', 'updated_at')
+    search_fields = ('bank__name', 'currency__short_name', 'type')
+    list_filter = ('type', 'bank', 'currency')
+
+
+@admin.register(RecordHourly, RecordDaily)
+class RecordRollupAdmin(ModelAdmin):
+    list_display = ('bank', 'currency', 'type', 'bucket',
+                    'open', 'high', 'low', 'close', 'count')
+    search_fields = ('bank__name', 'currency__short_name', 'type')
+    list_filter = ('type', 'bank', 'currency', 'bucket')
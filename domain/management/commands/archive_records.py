@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from domain.services.archive import (
+    get_months,
+    parse_month,
+    write_month_archive,
+)
+
+
+class Command(BaseCommand):
+    help = ("Writes Record history into one columnar archive per month "
+            "for offline analysis, see domain.services.archive.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Archive root directory')
+        parser.add_argument('--month', action='append',
+                            help='YYYY-MM, may be repeated; default all')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            months = [parse_month(month) for month in options['month']
+                      or []]
+        except ValueError as e:
+            raise CommandError(f'Invalid month: {e}')
+
+        for month in months or get_months():
+            rows = write_month_archive(options['directory'], month,
+                                       options['chunk_size'])
+            self.stdout.write(f'{month:%Y-%m}: {rows} records')
+        self.stdout.write(self.style.SUCCESS('Archive written'))
@@ -0,0 +1,65 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.renderers import JSON_BACKEND, dumps, stdlib_dumps
+
+
+def build_payload(banks, currencies):
+    """Synthetic /domain/currencies/ payload with every bank quoting every
+    currency, built in memory so no database is needed."""
+    now = timezone.now()
+    record_id = 0
+    payload = []
+    for bank in range(1, banks + 1):
+        bank_currencies = []
+        for currency in range(1, currencies + 1):
+            rates = {}
+            for type in ('buy', 'sell'):
+                record_id += 1
+                rates[type] = {
+                    'id': record_id,
+                    'value': Decimal(f'{100 + currency}.{bank:02d}'),
+                    'updated_at': now,
+                }
+            bank_currencies.append({
+                'id': currency,
+                'name': f'Currency {currency}',
+                'short_name': f'C{currency:02d}',
+                'country_flag': f'/media/flags/c{currency:02d}.png',
+                **rates,
+            })
+        payload.append({
+            'id': bank,
+            'name': f'Bank {bank}',
+            'logo': f'/media/logos/bank-{bank}.png',
+            'currencies': bank_currencies,
+        })
+    return payload
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks JSON serialization of a realistic currencies "
+            "payload with the stdlib encoder and common.renderers.dumps.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banks', type=int, default=50)
+        parser.add_argument('--currencies', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        payload = build_payload(options['banks'], options['currencies'])
+
+        self.stdout.write(f'{"encoder":<10}{"median (ms)":>14}{"bytes":>10}')
+        for name, encode in [('json', stdlib_dumps), (JSON_BACKEND, dumps)]:
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                body = encode(payload)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{name:<10}{statistics.median(timings):>14.3f}'
+                f'{len(body):>10}')
@@ -0,0 +1,140 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from domain.models import Bank, Currency, Record
+
+TYPE_CHOICES = ['buy', 'sell']
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks Record latest-value and history lookups with and "
+            "without the composite indexes. Run against a disposable "
+            "database: the indexes are dropped while synthetic records "
+            "are inserted until the table holds --rows rows, and the "
+            "synthetic records are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=50_000)
+        parser.add_argument('--yes-destroy', action='store_true',
+                            help='Confirm the default database is '
+                                 'disposable')
+
+    def handle(self, *args, **options):
+        if not options['yes_destroy']:
+            raise CommandError(
+                'benchmark_records drops indexes and writes synthetic '
+                'records into the default database '
+                f'({connection.settings_dict["NAME"]}). Point it at a '
+                'disposable database and pass --yes-destroy.')
+
+        banks = list(Bank.objects.values_list('id', flat=True))
+        currencies = list(Currency.objects.values_list('id', flat=True))
+        if not banks or not currencies:
+            raise CommandError('Seed banks and currencies first.')
+
+        samples = [
+            (random.choice(banks), random.choice(currencies),
+             random.choice(TYPE_CHOICES))
+            for _ in range(options['repeat'])
+        ]
+        indexes = Record._meta.indexes
+        # Every record above this id is synthetic
+        last_real_id = Record.objects.aggregate(
+            last_id=Max('id'))['last_id'] or 0
+
+        try:
+            # Load without the composite indexes; building them afterwards
+            # is much cheaper than maintaining them row by row.
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Record, index)
+            try:
+                self.populate(banks, currencies, options['rows'],
+                              options['batch_size'])
+                without_indexes = self.run_lookups(samples)
+            finally:
+                with connection.schema_editor() as editor:
+                    for index in indexes:
+                        editor.add_index(Record, index)
+            with_indexes = self.run_lookups(samples)
+        finally:
+            self.delete_synthetic(last_real_id)
+
+        self.stdout.write(
+            f'{"lookup":<10}{"no index (ms)":>16}{"indexed (ms)":>16}')
+        for name in with_indexes:
+            self.stdout.write(
+                f'{name:<10}{without_indexes[name]:>16.3f}'
+                f'{with_indexes[name]:>16.3f}')
+
+    def populate(self, banks, currencies, rows, batch_size):
+        existing = Record.objects.count()
+        missing = rows - existing
+        if missing <= 0:
+            return
+
+        table = connection.ops.quote_name(Record._meta.db_table)
+        sql = (f'INSERT INTO {table} '
+               '(bank_id, currency_id, type, value, created_at, updated_at) '
+               'VALUES (%s, %s, %s, %s, %s, %s)')
+        start = timezone.now() - timedelta(minutes=missing)
+
+        self.stdout.write(f'Inserting {missing} records...')
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, missing, batch_size):
+                batch = []
+                for minute in range(offset, min(offset + batch_size,
+                                                missing)):
+                    created_at = start + timedelta(minutes=minute)
+                    batch.append((
+                        random.choice(banks),
+                        random.choice(currencies),
+                        random.choice(TYPE_CHOICES),
+                        Decimal(random.randint(100, 20000)) / 100,
+                        created_at,
+                        created_at,
+                    ))
+                cursor.executemany(sql, batch)
+
+    def delete_synthetic(self, last_real_id):
+        # Raw DELETE: the synthetic rows have no dependents to collect
+        table = connection.ops.quote_name(Record._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id > %s',
+                           [last_real_id])
+            deleted = cursor.rowcount
+        if deleted:
+            self.stdout.write(f'Deleted {deleted} synthetic records')
+
+    def run_lookups(self, samples):
+        latest, history = [], []
+        for bank, currency, type in samples:
+            started = time.perf_counter()
+            list(Record.objects
+                 .filter(bank=bank, currency=currency, type=type)
+                 .order_by('-created_at')
+                 .values_list('value', flat=True)[:1])
+            latest.append(time.perf_counter() - started)
+
+            end = timezone.now()
+            started = time.perf_counter()
+            list(Record.objects
+                 .filter(currency=currency,
+                         created_at__range=(end - timedelta(days=1), end))
+                 .values_list('created_at', 'value'))
+            history.append(time.perf_counter() - started)
+
+        return {
+            'latest': statistics.median(latest) * 1000,
+            'history': statistics.median(history) * 1000,
+        }
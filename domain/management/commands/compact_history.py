@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from domain.models import (
+    AggregatorLog,
+    LatestRate,
+    Record,
+    RecordDaily,
+    RecordHourly,
+)
+
+
+class Command(BaseCommand):
+    help = ("Deletes Record and AggregatorLog rows older than the retention "
+            "horizon in small batches. Records are only deleted once their "
+            "hour and day are captured in the rollups, and records backing "
+            "a LatestRate are kept. Rollups of the pruned period are "
+            "marked compacted so rebuild_rollups leaves them alone.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help='Keep raw rows newer than this many days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        # Buckets losing raw records can no longer be rebuilt from Record
+        for model in (RecordHourly, RecordDaily):
+            model.objects.filter(bucket__lt=cutoff,
+                                 compacted=False).update(compacted=True)
+        records = self.delete_in_batches(
+            self.get_compactable_records(cutoff), options)
+        logs = self.delete_in_batches(
+            AggregatorLog.objects.filter(created_at__lt=cutoff), options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {records} records and {logs} logs older than '
+            f'{cutoff:%Y-%m-%d %H:%M}'))
+
+    def get_compactable_records(self, cutoff):
+        def captured_in(model, bucket):
+            return Exists(model.objects.filter(
+                bank=OuterRef('bank'),
+                currency=OuterRef('currency'),
+                type=OuterRef('type'),
+                bucket=OuterRef(bucket),
+            ))
+
+        latest_record_ids = (LatestRate.objects
+                             .filter(record__isnull=False)
+                             .values('record_id'))
+        return (Record.objects
+                .filter(created_at__lt=cutoff)
+                .annotate(hour=TruncHour('created_at'),
+                          day=TruncDay('created_at'))
+                .filter(captured_in(RecordHourly, 'hour'))
+                .filter(captured_in(RecordDaily, 'day'))
+                .exclude(id__in=latest_record_ids))
+
+    def delete_in_batches(self, queryset, options):
+        # Each batch is its own short transaction so locks are held briefly
+        deleted = 0
+        while True:
+            ids = list(queryset.order_by('id')
+                       .values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                return deleted
+            count, _ = queryset.model.objects.filter(id__in=ids).delete()
+            deleted += count
+            if options['pause']:
+                time.sleep(options['pause'])
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from domain.services.export import EXPORT_FORMATS, get_export_queryset
+from domain.utils import parse_timestamp
+
+
+class Command(BaseCommand):
+    help = ("Streams Record history as CSV or NDJSON to a file or stdout "
+            "without loading it into memory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS,
+                            default='csv')
+        parser.add_argument('--start', help='ISO date or datetime')
+        parser.add_argument('--end', help='ISO date or datetime')
+        parser.add_argument('--bank', type=int, action='append',
+                            help='Bank id, may be repeated')
+        parser.add_argument('--currency', action='append',
+                            help='Currency short name, may be repeated')
+        parser.add_argument('--output', help='File path, default stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            start = options['start'] and parse_timestamp(options['start'])
+            end = options['end'] and parse_timestamp(options['end'])
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        currency_codes = [code.upper()
+                          for code in options['currency'] or []]
+
+        records = get_export_queryset(start, end, options['bank'],
+                                      currency_codes)
+        iter_rows = EXPORT_FORMATS[options['format']][0]
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(iter_rows(records, options['chunk_size']))
+        else:
+            for line in iter_rows(records, options['chunk_size']):
+                self.stdout.write(line, ending='')
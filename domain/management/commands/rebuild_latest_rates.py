@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from domain.models import LatestRate, Record
+from domain.services.currencies import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the LatestRate table from Record history."
+
+    def handle(self, *args, **kwargs):
+        # order_by() clears the default ordering so it does not leak into
+        # the GROUP BY clause.
+        latest_ids = (Record.objects.order_by()
+                      .values('bank', 'currency', 'type')
+                      .annotate(latest_id=Max('id'))
+                      .values('latest_id'))
+        records = Record.objects.filter(id__in=latest_ids)
+
+        latest_rates = [
+            LatestRate(
+                bank_id=record.bank_id,
+                currency_id=record.currency_id,
+                type=record.type,
+                record=record,
+                value=record.value,
+            )
+            for record in records.iterator()
+        ]
+
+        with transaction.atomic():
+            LatestRate.objects.all().delete()
+            LatestRate.objects.bulk_create(latest_rates, batch_size=500)
+        publish_snapshot()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(latest_rates)} latest rates'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from domain.models import RecordDaily, RecordHourly
+from domain.services.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the hourly and daily rate rollups from Record history."
+
+    def handle(self, *args, **kwargs):
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {RecordHourly.objects.count()} hourly and '
+            f'{RecordDaily.objects.count()} daily rollups'))
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db.utils import IntegrityError
 
+from aggregator.scrapers import registry
 from domain.models import Bank
 from domain.models import Currency
 
@@ -44,6 +45,11 @@ class Command(BaseCommand):
                     self.style.SUCCESS(f'Created new Bank: {name}'))
 
         self.stdout.write(self.style.SUCCESS('Bank seeding completed!'))
+
+        for name in registry.get_missing(
+                [bank_data.get('name') for bank_data in banks_data]):
+            self.stdout.write(
+                self.style.ERROR(f'No spider registered for Bank: {name}'))
         # -----------------------------------------------------------------------
         currencies = [
             {"country": "United States", "currency": "United States Dollar", "code": "USD"}, # noqa
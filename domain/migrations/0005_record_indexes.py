@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("domain", "0004_latestrate"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["bank", "currency", "type", "-created_at"],
+                name="record_latest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["currency", "created_at"], name="record_currency_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("domain", "0005_record_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aggregatorlog",
+            name="type",
+            field=models.CharField(
+                choices=[("buy", "Buy"), ("sell", "Sell"), ("scrape", "Scrape")],
+                max_length=6,
+            ),
+        ),
+    ]
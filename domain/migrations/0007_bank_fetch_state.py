@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("domain", "0006_aggregatorlog_scrape_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bank",
+            name="fetch_content_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="bank",
+            name="fetch_etag",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="bank",
+            name="fetch_last_modified",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("domain", "0008_record_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recorddaily",
+            name="compacted",
+            field=models.BooleanField(
+                default=False,
+                help_text="Raw records may have been pruned; kept by rebuilds",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordhourly",
+            name="compacted",
+            field=models.BooleanField(
+                default=False,
+                help_text="Raw records may have been pruned; kept by rebuilds",
+            ),
+        ),
+    ]
@@ -11,12 +11,23 @@ TYPE_CHOICES = [
         ('sell', 'Sell'),
     ]
 
+LOG_TYPE_CHOICES = TYPE_CHOICES + [
+        ('scrape', 'Scrape'),
+    ]
+
 
 class Bank(TimeStampedModel):
     logo = models.ImageField(upload_to='domain/bank/bank_logos/')
     name = models.CharField(max_length=255, unique=True)
     forex_link = models.CharField(max_length=255, blank=True, null=True)
     last_checked = models.DateTimeField(blank=True, null=True)
+    # Validators from the last fetch of forex_link, used to skip unchanged
+    # pages on the next one
+    fetch_etag = models.CharField(max_length=255, blank=True, null=True)
+    fetch_last_modified = models.CharField(max_length=255,
+                                           blank=True, null=True)
+    fetch_content_hash = models.CharField(max_length=64,
+                                          blank=True, null=True)
 
     def __str__(self):
         return self.name
@@ -38,7 +49,7 @@ class Currency(TimeStampedModel):
 class AggregatorLog(TimeStampedModel):
     bank = models.ForeignKey(Bank, on_delete=models.CASCADE,
                              related_name='logs')
-    type = models.CharField(max_length=4, choices=TYPE_CHOICES)
+    type = models.CharField(max_length=6, choices=LOG_TYPE_CHOICES)
     status = models.CharField(max_length=7, choices=STATUS_CHOICES)
 
     def __str__(self):
@@ -56,5 +67,80 @@ class Record(TimeStampedModel):
     value = models.DecimalField(max_digits=10,
                                 decimal_places=2)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            # Latest value per (bank, currency, type)
+            models.Index(fields=['bank', 'currency', 'type', '-created_at'],
+                         name='record_latest_idx'),
+            # Currency history over a time range
+            models.Index(fields=['currency', 'created_at'],
+                         name='record_currency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.bank.name} - {self.currency.short_name} - {self.type}' # noqa
+
+
+class LatestRate(TimeStampedModel):
+    bank = models.ForeignKey(Bank,
+                             on_delete=models.CASCADE,
+                             related_name='latest_rates')
+    currency = models.ForeignKey(Currency,
+                                 on_delete=models.CASCADE,
+                                 related_name='latest_rates')
+    type = models.CharField(max_length=4,
+                            choices=TYPE_CHOICES)
+    record = models.ForeignKey(Record,
+                               on_delete=models.SET_NULL,
+                               blank=True, null=True,
+                               related_name='+')
+    value = models.DecimalField(max_digits=10,
+                                decimal_places=2)
+
+    class Meta(TimeStampedModel.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['bank', 'currency', 'type'],
+                                    name='unique_latest_rate'),
+        ]
+
     def __str__(self):
         return f'{self.bank.name} - {self.currency.short_name} - {self.type}' # noqa
+
+
+class RecordRollup(TimeStampedModel):
+    bank = models.ForeignKey(Bank,
+                             on_delete=models.CASCADE,
+                             related_name='+')
+    currency = models.ForeignKey(Currency,
+                                 on_delete=models.CASCADE,
+                                 related_name='+')
+    type = models.CharField(max_length=4,
+                            choices=TYPE_CHOICES)
+    bucket = models.DateTimeField(help_text='Start of the period')
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    count = models.PositiveIntegerField()
+    compacted = models.BooleanField(
+        default=False,
+        help_text='Raw records may have been pruned; kept by rebuilds')
+
+    class Meta(TimeStampedModel.Meta):
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bank', 'currency', 'type', 'bucket'],
+                name='%(class)s_unique_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.bank.name} - {self.currency.short_name} - {self.type} - {self.bucket}' # noqa
+
+
+class RecordHourly(RecordRollup):
+    pass
+
+
+class RecordDaily(RecordRollup):
+    pass
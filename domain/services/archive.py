@@ -0,0 +1,157 @@
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+from django.utils import timezone
+
+from domain.models import Record
+
+# Values are stored as integer cents, matching Record.value's two places
+VALUE_SCALE = 100
+TYPES = ['buy', 'sell']
+
+# Column name -> dtype, one .npy file per column in each month directory
+COLUMNS = {
+    'id': np.int64,
+    'created_at': np.int64,
+    'bank': np.int32,
+    'currency': np.int32,
+    'type': np.int8,
+    'value': np.int64,
+}
+
+
+def get_months():
+    """Month start of every month that has records, oldest first."""
+    return list(Record.objects.datetimes('created_at', 'month'))
+
+
+def month_bounds(month):
+    start = timezone.localtime(month).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def write_month_archive(directory, month, chunk_size=5000):
+    """
+    Write one month of Record history to ``directory/YYYY-MM`` as
+    columnar .npy files and return the number of rows written.
+
+    Bank and currency are dictionary encoded (codes index the lists in
+    meta.json), values are fixed-point cents and created_at is epoch
+    seconds. Columns are preallocated on disk and filled chunk by chunk.
+    """
+    start, end = month_bounds(month)
+    records = (Record.objects
+               .filter(created_at__gte=start, created_at__lt=end)
+               .order_by('id'))
+    rows = records.count()
+
+    path = os.path.join(directory, f'{start:%Y-%m}')
+    os.makedirs(path, exist_ok=True)
+    columns = {
+        name: np.lib.format.open_memmap(
+            os.path.join(path, f'{name}.npy'), mode='w+', dtype=dtype,
+            shape=(rows,))
+        for name, dtype in COLUMNS.items()
+    }
+
+    banks, currencies = {}, {}
+    type_codes = {type: code for code, type in enumerate(TYPES)}
+    row = 0
+    for id, created_at, bank, currency, type, value in records.values_list(
+            'id', 'created_at', 'bank__name', 'currency__short_name',
+            'type', 'value').iterator(chunk_size=chunk_size):
+        if row == rows:
+            # Rows inserted after the count belong to the next run
+            break
+        columns['id'][row] = id
+        columns['created_at'][row] = int(created_at.timestamp())
+        columns['bank'][row] = banks.setdefault(bank, len(banks))
+        columns['currency'][row] = currencies.setdefault(
+            currency, len(currencies))
+        columns['type'][row] = type_codes[type]
+        columns['value'][row] = int(
+            (Decimal(value) * VALUE_SCALE).to_integral_value())
+        row += 1
+
+    for column in columns.values():
+        column.flush()
+    with open(os.path.join(path, 'meta.json'), 'w') as meta:
+        json.dump({
+            'month': f'{start:%Y-%m}',
+            'rows': row,
+            'banks': list(banks),
+            'currencies': list(currencies),
+            'types': TYPES,
+            'value_scale': VALUE_SCALE,
+        }, meta)
+    return row
+
+
+class RecordArchive:
+    """
+    Read-only view of one archived month. Columns are memory-mapped, so
+    opening an archive costs nothing until its pages are scanned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta:
+            self.meta = json.load(meta)
+        rows = self.meta['rows']
+        self.columns = {
+            name: np.load(os.path.join(path, f'{name}.npy'),
+                          mmap_mode='r')[:rows]
+            for name in COLUMNS
+        }
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, bank=None, currency=None, type=None):
+        """Boolean row mask for the given bank name, currency and type."""
+        mask = np.ones(len(self), dtype=bool)
+        for name, value, labels in [
+                ('bank', bank, self.meta['banks']),
+                ('currency', currency, self.meta['currencies']),
+                ('type', type, self.meta['types'])]:
+            if value is None:
+                continue
+            if value not in labels:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.columns[name] == labels.index(value)
+        return mask
+
+    def values(self, mask=None):
+        values = self.columns['value']
+        if mask is not None:
+            values = values[mask]
+        return values / self.meta['value_scale']
+
+    def timestamps(self, mask=None):
+        seconds = self.columns['created_at']
+        if mask is not None:
+            seconds = seconds[mask]
+        return seconds.astype('datetime64[s]')
+
+
+def open_archives(directory):
+    """Every RecordArchive under ``directory``, oldest month first."""
+    return [RecordArchive(os.path.join(directory, name))
+            for name in sorted(os.listdir(directory))
+            if os.path.exists(os.path.join(directory, name, 'meta.json'))]
+
+
+def parse_month(value):
+    """Parse YYYY-MM into an aware datetime at the start of that month."""
+    return timezone.make_aware(datetime.strptime(value, '%Y-%m'))
@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.http import quote_etag
+
+from common.renderers import dumps
+from domain.models import Bank, Currency, LatestRate, Record
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_KEY = 'domain:currencies:snapshot'
+
+# When this process last compared its snapshot with the data version
+_version_checked_at = None
+
+
+def get_data_version():
+    """Newest Record id; it only grows, so it doubles as a data version."""
+    return Record.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def get_data_stamp():
+    """
+    Fingerprint of every table the payload is built from. Besides new
+    Records it changes when LatestRate is rebuilt or a Bank or Currency
+    is edited, added or deleted, none of which moves the data version.
+    """
+    values = [get_data_version()]
+    for model in (LatestRate, Bank, Currency):
+        values.extend(model.objects.aggregate(
+            count=Count('id'), newest=Max('updated_at')).values())
+    return hashlib.md5(repr(values).encode()).hexdigest()
+
+
+def get_last_modified():
+    """
+    Newest Record.created_at or Bank.last_checked as a Unix timestamp,
+    resolved with aggregates so no rows are loaded.
+    """
+    newest = [
+        Record.objects.aggregate(newest=Max('created_at'))['newest'],
+        Bank.objects.aggregate(newest=Max('last_checked'))['newest'],
+    ]
+    newest = [value for value in newest if value is not None]
+    return int(max(newest).timestamp()) if newest else None
+
+
+BANK_FIELDS = ['id', 'name', 'logo']
+CURRENCY_FIELDS = ['id', 'name', 'short_name', 'country_flag', 'buy', 'sell']
+
+
+def build_bank_currencies(bank_ids=None, currency_codes=None,
+                          bank_fields=None, fields=None):
+    """
+    Return the /domain/currencies/ payload in two queries.
+
+    Optional bank ids and currency codes filter the rows in SQL, and
+    ``bank_fields`` / ``fields`` pick the bank and currency keys to
+    include; only the columns those keys need are selected.
+    """
+    bank_fields = bank_fields or BANK_FIELDS
+    fields = fields or CURRENCY_FIELDS
+    types = [type for type in ('buy', 'sell') if type in fields]
+
+    rates = (LatestRate.objects
+             .select_related('currency')
+             .only('bank', 'currency', 'type', 'record', 'value',
+                   *[f'currency__{field}' for field in fields
+                     if field not in types])
+             .order_by('bank_id', 'currency_id'))
+    banks = Bank.objects.only(*bank_fields)
+    if bank_ids:
+        rates = rates.filter(bank_id__in=bank_ids)
+        banks = banks.filter(id__in=bank_ids)
+    if currency_codes:
+        rates = rates.filter(currency__short_name__in=currency_codes)
+    if len(types) == 1:
+        rates = rates.filter(type=types[0])
+
+    rates_by_bank = defaultdict(dict)
+    for rate in rates:
+        currencies = rates_by_bank[rate.bank_id]
+        currency = rate.currency
+        if currency.id not in currencies:
+            currencies[currency.id] = {
+                'id': currency.id,
+                'name': currency.name if 'name' in fields else None,
+                'short_name': currency.short_name if 'short_name' in fields else None, # noqa
+                'country_flag': currency.country_flag.url if 'country_flag' in fields and currency.country_flag else None, # noqa
+                'buy': None,
+                'sell': None
+            }
+        currencies[currency.id][rate.type] = {
+            'id': rate.record_id,
+            'value': str(rate.value)
+        }
+
+    response_data = []
+    for bank in banks:
+        response_data.append(project({
+            'id': bank.id,
+            'name': bank.name if 'name' in bank_fields else None,
+            'logo': bank.logo.url if 'logo' in bank_fields and bank.logo else None, # noqa
+            'currencies': [project(currency, fields) for currency
+                           in rates_by_bank[bank.id].values()]
+        }, [*bank_fields, 'currencies']))
+    return response_data
+
+
+def project(item, fields):
+    # Keys of item that were asked for, in payload order
+    return {key: value for key, value in item.items() if key in fields}
+
+
+def get_changes_since(since, version):
+    """
+    LatestRate rows whose record is newer than ``since``, with the version
+    the client should send next. Record ids only grow, so the cursor
+    cannot skip rows the way a timestamp could.
+    """
+    if since >= version:
+        return version, []
+    rates = (LatestRate.objects
+             .filter(record_id__gt=since)
+             .order_by('record_id')
+             .values_list('record_id', 'bank_id', 'currency_id',
+                          'currency__short_name', 'type', 'value'))
+    changes = [
+        {
+            'id': record_id,
+            'bank': bank_id,
+            'currency': currency_id,
+            'short_name': short_name,
+            'type': type,
+            'value': str(value),
+        }
+        for record_id, bank_id, currency_id, short_name, type, value in rates
+    ]
+    if changes:
+        version = max(version, changes[-1]['id'])
+    return version, changes
+
+
+def publish_snapshot():
+    """Render the payload once and store the bytes for the read path."""
+    version = get_data_version()
+    stamp = get_data_stamp()
+    last_modified = get_last_modified()
+    body = dumps(build_bank_currencies())
+    snapshot = make_snapshot(version, stamp, last_modified, body)
+
+    path = settings.CURRENCIES_SNAPSHOT_FILE
+    if path:
+        snapshot['mtime'] = write_snapshot_file(
+            path, version, stamp, last_modified, body)
+
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot,
+              timeout=settings.CURRENCIES_SNAPSHOT_CACHE_TIMEOUT)
+    mark_version_checked()
+    logger.info(f"Published currencies snapshot version {version}")
+    return snapshot
+
+
+def get_snapshot():
+    """
+    Return the latest published snapshot, publishing one if none exists.
+
+    When a snapshot file is configured its mtime is compared with the
+    cached copy, so processes that did not run the scrape still pick up
+    new data without querying the database. Otherwise the cached
+    stamp is compared with get_data_stamp() at most every
+    CURRENCIES_SNAPSHOT_CHECK_INTERVAL seconds and republished when
+    another process has changed the data without publishing.
+    """
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+
+    path = settings.CURRENCIES_SNAPSHOT_FILE
+    if path:
+        mtime = get_snapshot_file_mtime(path)
+        if mtime is not None and (
+                snapshot is None or snapshot['mtime'] != mtime):
+            snapshot = read_snapshot_file(path, mtime)
+            cache.set(SNAPSHOT_CACHE_KEY, snapshot,
+                      timeout=settings.CURRENCIES_SNAPSHOT_CACHE_TIMEOUT)
+
+    if snapshot is None:
+        return publish_snapshot()
+    if version_check_due():
+        mark_version_checked()
+        if get_data_stamp() != snapshot.get('stamp'):
+            snapshot = publish_snapshot()
+    return snapshot
+
+
+async def aget_snapshot():
+    """
+    Async get_snapshot. A fresh cached snapshot is returned without
+    leaving the event loop; reading the file or publishing runs in a
+    worker thread.
+    """
+    snapshot = await cache.aget(SNAPSHOT_CACHE_KEY)
+    if snapshot is not None:
+        path = settings.CURRENCIES_SNAPSHOT_FILE
+        mtime = get_snapshot_file_mtime(path) if path else None
+        if ((mtime is None or snapshot['mtime'] == mtime)
+                and not version_check_due()):
+            return snapshot
+    return await sync_to_async(get_snapshot)()
+
+
+def version_check_due():
+    interval = settings.CURRENCIES_SNAPSHOT_CHECK_INTERVAL
+    if interval is None:
+        return False
+    return (_version_checked_at is None
+            or time.monotonic() - _version_checked_at >= interval)
+
+
+def mark_version_checked():
+    global _version_checked_at
+    _version_checked_at = time.monotonic()
+
+
+def get_snapshot_file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def make_snapshot(version, stamp, last_modified, body, mtime=None):
+    return {
+        'version': version,
+        'stamp': stamp,
+        'last_modified': last_modified,
+        'etag': quote_etag(hashlib.md5(body).hexdigest()),
+        'body': body,
+        'mtime': mtime,
+    }
+
+
+def write_snapshot_file(path, version, stamp, last_modified, body):
+    # Write then rename so readers never see a partial file
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as snapshot_file:
+        snapshot_file.write(
+            f'{version} {stamp} {last_modified or 0}\n'.encode())
+        snapshot_file.write(body)
+    os.replace(tmp_path, path)
+    return os.stat(path).st_mtime_ns
+
+
+def read_snapshot_file(path, mtime):
+    with open(path, 'rb') as snapshot_file:
+        header, body = snapshot_file.read().split(b'\n', 1)
+    version, stamp, last_modified = header.decode().split()
+    return make_snapshot(int(version), stamp, int(last_modified) or None,
+                         body, mtime)
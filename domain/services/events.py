@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SEQUENCE_KEY = 'domain:rate_events:sequence'
+
+
+def event_key(event_id):
+    return f'domain:rate_events:{event_id}'
+
+
+class LocalSubscription:
+    def __init__(self, broker, loop):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.RATE_EVENTS_QUEUE_SIZE)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop; a client that stopped reading
+        # loses its oldest messages instead of growing without bound
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Messages published since the last call, [] after ``timeout``."""
+        try:
+            messages = [await asyncio.wait_for(self.queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return messages
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In-process pub/sub. Publishing from any thread hands each message to
+    the event loop of every subscriber, so it only reaches clients
+    connected to the process that ran the scrape.
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def publish(self, events):
+        with self.lock:
+            self.sequence += 1
+            message = (self.sequence, events)
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has already closed
+                self.unsubscribe(subscription)
+        return message[0]
+
+    async def subscribe(self, last_id=None):
+        # Missed messages are not kept, so last_id cannot be replayed
+        subscription = LocalSubscription(self, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+class CacheSubscription:
+    def __init__(self, last_id):
+        self.last_id = last_id
+
+    async def get(self, timeout):
+        """Messages after ``last_id``, polling the cache until ``timeout``."""
+        interval = settings.RATE_EVENTS_POLL_INTERVAL
+        waited = 0
+        while True:
+            sequence = await cache.aget(EVENTS_SEQUENCE_KEY, 0)
+            if sequence > self.last_id:
+                # Replay at most one queue's worth, like LocalSubscription
+                first = max(self.last_id,
+                            sequence - settings.RATE_EVENTS_QUEUE_SIZE)
+                ids = range(first + 1, sequence + 1)
+                found = await cache.aget_many([event_key(id) for id in ids])
+                self.last_id = sequence
+                # Messages that already expired are skipped
+                return [(id, found[event_key(id)]) for id in ids
+                        if event_key(id) in found]
+            if waited >= timeout:
+                return []
+            await asyncio.sleep(interval)
+            waited += interval
+
+    def close(self):
+        pass
+
+
+class CacheBroker:
+    """
+    Stand-in for an external broker when scrapes and web workers run in
+    separate processes. Messages are numbered with an atomic counter in
+    the shared cache and kept for RATE_EVENTS_RETENTION seconds, and
+    subscribers poll for new numbers, which also lets a reconnecting
+    client resume from its Last-Event-ID, replaying at most
+    RATE_EVENTS_QUEUE_SIZE messages.
+    """
+
+    def publish(self, events):
+        cache.add(EVENTS_SEQUENCE_KEY, 0, timeout=None)
+        event_id = cache.incr(EVENTS_SEQUENCE_KEY)
+        cache.set(event_key(event_id), events,
+                  timeout=settings.RATE_EVENTS_RETENTION)
+        return event_id
+
+    async def subscribe(self, last_id=None):
+        sequence = await cache.aget(EVENTS_SEQUENCE_KEY, 0)
+        if last_id is None or last_id > sequence:
+            last_id = sequence
+        return CacheSubscription(
+            max(last_id, sequence - settings.RATE_EVENTS_QUEUE_SIZE))
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'cache': CacheBroker,
+}
+_brokers = {}
+
+
+def get_broker():
+    """The broker selected by RATE_EVENTS_BROKER, one per process."""
+    name = settings.RATE_EVENTS_BROKER
+    if name not in _brokers:
+        _brokers[name] = BROKERS[name]()
+    return _brokers[name]
+
+
+def publish_rate_changes(changes):
+    """Publish one scrape's changed rates as a single message."""
+    if not changes:
+        return None
+    event_id = get_broker().publish(changes)
+    logger.info(f"Published {len(changes)} rate changes as event {event_id}")
+    return event_id
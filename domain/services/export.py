@@ -0,0 +1,98 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from domain.models import Record
+
+EXPORT_COLUMNS = ['id', 'created_at', 'bank', 'currency', 'type', 'value']
+
+
+def get_export_queryset(start=None, end=None, bank_ids=None,
+                        currency_codes=None):
+    """Records joined with bank and currency names, oldest first."""
+    records = Record.objects.all()
+    if start:
+        records = records.filter(created_at__gte=start)
+    if end:
+        records = records.filter(created_at__lt=end)
+    if bank_ids:
+        records = records.filter(bank_id__in=bank_ids)
+    if currency_codes:
+        records = records.filter(currency__short_name__in=currency_codes)
+    return (records.order_by('id')
+            .values_list('id', 'created_at', 'bank__name',
+                         'currency__short_name', 'type', 'value'))
+
+
+class Echo:
+    """File-like object whose write returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_row(row):
+    id, created_at, bank, currency, type, value = row
+    return [id, created_at.isoformat(), bank, currency, type, value]
+
+
+def ndjson_line(row):
+    id, created_at, bank, currency, type, value = row
+    return json.dumps({
+        'id': id,
+        'created_at': created_at.isoformat(),
+        'bank': bank,
+        'currency': currency,
+        'type': type,
+        'value': str(value),
+    }) + '\n'
+
+
+def iter_csv(records, chunk_size=2000):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in records.iterator(chunk_size=chunk_size):
+        yield writer.writerow(csv_row(row))
+
+
+def iter_ndjson(records, chunk_size=2000):
+    for row in records.iterator(chunk_size=chunk_size):
+        yield ndjson_line(row)
+
+
+# Async counterparts for ASGI, where Django would otherwise collect a sync
+# iterator into a list before sending it
+
+async def aiter_records(records, chunk_size=2000):
+    """
+    Rows of ``records`` fetched one chunk at a time in the database
+    thread. QuerySet.aiterator() runs values_list queries on the event
+    loop in Django 5.1, so the sync iterator is driven from a thread.
+    """
+    rows = records.iterator(chunk_size=chunk_size)
+    fetch = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await fetch():
+        for row in chunk:
+            yield row
+
+
+async def aiter_csv(records, chunk_size=2000):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    async for row in aiter_records(records, chunk_size):
+        yield writer.writerow(csv_row(row))
+
+
+async def aiter_ndjson(records, chunk_size=2000):
+    async for row in aiter_records(records, chunk_size):
+        yield ndjson_line(row)
+
+
+# Export format -> (row iterator, async row iterator, content type,
+# file extension)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, aiter_csv, 'text/csv', 'csv'),
+    'ndjson': (iter_ndjson, aiter_ndjson, 'application/x-ndjson', 'ndjson'),
+}
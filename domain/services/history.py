@@ -0,0 +1,48 @@
+from domain.models import RecordDaily, RecordHourly
+
+INTERVALS = {
+    '1h': RecordHourly,
+    '1d': RecordDaily,
+}
+
+
+def get_history_queryset(bank_id, currency_code, type, start, end,
+                         interval):
+    return (
+        INTERVALS[interval].objects
+        .filter(bank_id=bank_id,
+                currency__short_name=currency_code,
+                type=type,
+                bucket__gte=start,
+                bucket__lt=end)
+        .order_by('bucket')
+        .values_list('bucket', 'open', 'high', 'low', 'close', 'count')
+    )
+
+
+def format_point(bucket, open, high, low, close, count):
+    return {
+        'time': bucket,
+        'open': f'{open:.2f}',
+        'high': f'{high:.2f}',
+        'low': f'{low:.2f}',
+        'close': f'{close:.2f}',
+        'count': count,
+    }
+
+
+def get_history(bank_id, currency_code, type, start, end, interval):
+    """
+    Open/high/low/close points for one rate from the rollup table of the
+    requested interval, for buckets starting within [start, end).
+    """
+    points = get_history_queryset(bank_id, currency_code, type, start, end,
+                                  interval)
+    return [format_point(*point) for point in points]
+
+
+async def aget_history(bank_id, currency_code, type, start, end, interval):
+    """get_history using the async ORM."""
+    points = get_history_queryset(bank_id, currency_code, type, start, end,
+                                  interval)
+    return [format_point(*point) async for point in points]
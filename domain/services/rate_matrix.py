@@ -0,0 +1,160 @@
+import threading
+
+import numpy as np
+from asgiref.sync import sync_to_async
+
+from domain.models import LatestRate
+from domain.services.currencies import aget_snapshot, get_snapshot
+
+# Bank rates are quoted in Kenyan Shillings per unit of foreign currency
+BASE_CURRENCY = 'KES'
+
+_matrix = None
+_matrix_lock = threading.Lock()
+
+
+class RateMatrix:
+    """
+    Latest buy/sell values as (currency x bank) arrays, NaN where a bank
+    has no rate, so conversions are array lookups instead of queries.
+    """
+
+    def __init__(self, key, bank_ids, bank_names, currency_codes, buy, sell):
+        self.key = key
+        self.bank_ids = bank_ids
+        self.bank_names = bank_names
+        self.currency_codes = currency_codes
+        self.bank_index = {bank_id: i for i, bank_id in enumerate(bank_ids)}
+        self.currency_index = {
+            code: i for i, code in enumerate(currency_codes)}
+        self.buy = buy
+        self.sell = sell
+        self._best_rates = None
+
+    @classmethod
+    def build(cls, key):
+        rates = list(LatestRate.objects.values_list(
+            'bank_id', 'bank__name', 'currency__short_name', 'type', 'value'))
+
+        banks = dict(sorted({(row[0], row[1]) for row in rates}))
+        currency_codes = sorted({row[2] for row in rates})
+        bank_index = {bank_id: i for i, bank_id in enumerate(banks)}
+        currency_index = {code: i for i, code in enumerate(currency_codes)}
+
+        shape = (len(currency_codes), len(banks))
+        values = {'buy': np.full(shape, np.nan),
+                  'sell': np.full(shape, np.nan)}
+        for bank_id, _, code, type, value in rates:
+            # A zero or negative quote is a scrape error; leave it missing
+            if value <= 0:
+                continue
+            row, column = currency_index[code], bank_index[bank_id]
+            values[type][row, column] = float(value)
+
+        return cls(key, list(banks), list(banks.values()), currency_codes,
+                   values['buy'], values['sell'])
+
+    def has_currency(self, code):
+        return code == BASE_CURRENCY or code in self.currency_index
+
+    def to_base(self, code):
+        """KES received per unit of ``code`` sold to each bank."""
+        if code == BASE_CURRENCY:
+            return np.ones(len(self.bank_ids))
+        return self.buy[self.currency_index[code]]
+
+    def from_base(self, code):
+        """KES paid per unit of ``code`` bought from each bank."""
+        if code == BASE_CURRENCY:
+            return np.ones(len(self.bank_ids))
+        return self.sell[self.currency_index[code]]
+
+    def cross_rates(self, from_code, to_code):
+        """Units of ``to_code`` per unit of ``from_code`` at every bank."""
+        return self.to_base(from_code) / self.from_base(to_code)
+
+    def best_rates(self):
+        """
+        Best bank per currency and spread statistics, computed with one
+        vectorized pass over the bank axis and kept for this version.
+        """
+        if self._best_rates is not None:
+            return self._best_rates
+        if not self.bank_ids:
+            self._best_rates = []
+            return self._best_rates
+
+        buy_missing = np.isnan(self.buy)
+        sell_missing = np.isnan(self.sell)
+        # Highest buy and lowest sell are best for the customer
+        best_buy = np.where(buy_missing, -np.inf, self.buy).argmax(axis=1)
+        best_sell = np.where(sell_missing, np.inf, self.sell).argmin(axis=1)
+        has_buy = ~buy_missing.all(axis=1)
+        has_sell = ~sell_missing.all(axis=1)
+
+        spread = self.sell - self.buy
+        spread_missing = np.isnan(spread)
+        spread_banks = (~spread_missing).sum(axis=1)
+        spread_min = np.where(spread_missing, np.inf, spread).min(axis=1)
+        spread_max = np.where(spread_missing, -np.inf, spread).max(axis=1)
+        spread_sum = np.where(spread_missing, 0, spread).sum(axis=1)
+
+        results = []
+        for row, code in enumerate(self.currency_codes):
+            result = {
+                'currency': code,
+                'best_buy': None,
+                'best_sell': None,
+                'spread': None,
+            }
+            if has_buy[row]:
+                result['best_buy'] = self.bank_rate(
+                    best_buy[row], self.buy[row, best_buy[row]])
+            if has_sell[row]:
+                result['best_sell'] = self.bank_rate(
+                    best_sell[row], self.sell[row, best_sell[row]])
+            if spread_banks[row]:
+                result['spread'] = {
+                    'min': f'{spread_min[row]:.2f}',
+                    'max': f'{spread_max[row]:.2f}',
+                    'mean': f'{spread_sum[row] / spread_banks[row]:.2f}',
+                    'banks': int(spread_banks[row]),
+                }
+            results.append(result)
+
+        self._best_rates = results
+        return results
+
+    def bank_rate(self, column, value):
+        return {
+            'bank_id': self.bank_ids[column],
+            'bank_name': self.bank_names[column],
+            'value': f'{value:.2f}',
+        }
+
+
+def get_rate_matrix():
+    """
+    Return this process's RateMatrix, rebuilding it only when the
+    published currencies snapshot has changed.
+    """
+    global _matrix
+    snapshot = get_snapshot()
+    key = (snapshot['version'], snapshot['etag'])
+    matrix = _matrix
+    if matrix is None or matrix.key != key:
+        with _matrix_lock:
+            if _matrix is None or _matrix.key != key:
+                _matrix = RateMatrix.build(key)
+            matrix = _matrix
+    return matrix
+
+
+async def aget_rate_matrix():
+    """Async get_rate_matrix; rebuilds run in a worker thread."""
+    snapshot = await aget_snapshot()
+    matrix = _matrix
+    if matrix is not None and matrix.key == (snapshot['version'],
+                                             snapshot['etag']):
+        return matrix
+    return await sync_to_async(get_rate_matrix)()
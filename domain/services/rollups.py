@@ -0,0 +1,144 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from domain.models import Record, RecordDaily, RecordHourly
+
+
+def truncate_hour(value):
+    return timezone.localtime(value).replace(
+        minute=0, second=0, microsecond=0)
+
+
+def truncate_day(value):
+    return timezone.localtime(value).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+
+
+# Rollup model, Python truncation for incremental updates and the matching
+# database function for rebuilds
+ROLLUPS = [
+    (RecordHourly, truncate_hour, TruncHour),
+    (RecordDaily, truncate_day, TruncDay),
+]
+
+
+def update_rollups(records):
+    """
+    Fold newly saved records into the hourly and daily rollups with two
+    queries per table: one read and one upsert.
+    """
+    if not records:
+        return
+
+    records = sorted(records, key=lambda record: record.id)
+    for model, truncate, _ in ROLLUPS:
+        values_by_key = {}
+        for record in records:
+            key = (record.bank_id, record.currency_id, record.type,
+                   truncate(record.created_at))
+            values_by_key.setdefault(key, []).append(
+                Decimal(str(record.value)))
+
+        existing = {
+            (rollup.bank_id, rollup.currency_id, rollup.type,
+             rollup.bucket): rollup
+            for rollup in model.objects.filter(
+                bank_id__in={key[0] for key in values_by_key},
+                bucket__in={key[3] for key in values_by_key})
+        }
+
+        rollups = []
+        for key, values in values_by_key.items():
+            bank_id, currency_id, type, bucket = key
+            rollup = existing.get(key)
+            if rollup is None:
+                open, high, low = values[0], max(values), min(values)
+                count = len(values)
+            else:
+                open = rollup.open
+                high = max(rollup.high, *values)
+                low = min(rollup.low, *values)
+                count = rollup.count + len(values)
+            rollups.append(model(
+                bank_id=bank_id,
+                currency_id=currency_id,
+                type=type,
+                bucket=bucket,
+                open=open,
+                high=high,
+                low=low,
+                close=values[-1],
+                count=count,
+            ))
+
+        # Unsaved instances for new and existing buckets alike, so Django
+        # issues one upsert however the batch splits between them
+        model.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['bank', 'currency', 'type', 'bucket'],
+            update_fields=['high', 'low', 'close', 'count', 'updated_at'],
+        )
+
+
+def rebuild_rollups(batch_size=1000):
+    """
+    Recompute rollups from Record, aggregating in the database.
+
+    Buckets marked compacted by compact_history are kept as they are and
+    their remaining records skipped, since part of their raw history is
+    gone.
+    """
+    with transaction.atomic():
+        for model, _, trunc in ROLLUPS:
+            model.objects.filter(compacted=False).delete()
+
+            compacted = model.objects.filter(
+                compacted=True,
+                bank=OuterRef('bank'),
+                currency=OuterRef('currency'),
+                type=OuterRef('type'),
+                bucket=OuterRef('bucket'),
+            )
+            buckets = (
+                Record.objects
+                .order_by()
+                .annotate(bucket=trunc('created_at'))
+                .exclude(Exists(compacted))
+                .values('bank', 'currency', 'type', 'bucket')
+                .annotate(open_id=Min('id'),
+                          close_id=Max('id'),
+                          high=Max('value'),
+                          low=Min('value'),
+                          count=Count('id'))
+            )
+            # First and last value of each bucket, looked up by id
+            values = dict(
+                Record.objects
+                .filter(Q(id__in=buckets.values('open_id'))
+                        | Q(id__in=buckets.values('close_id')))
+                .order_by()
+                .values_list('id', 'value')
+            )
+
+            model.objects.bulk_create(
+                (
+                    model(
+                        bank_id=bucket['bank'],
+                        currency_id=bucket['currency'],
+                        type=bucket['type'],
+                        bucket=bucket['bucket'],
+                        open=values[bucket['open_id']],
+                        high=bucket['high'],
+                        low=bucket['low'],
+                        close=values[bucket['close_id']],
+                        count=bucket['count'],
+                    )
+                    for bucket in buckets.iterator()
+                ),
+                batch_size=batch_size,
+            )
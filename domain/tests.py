@@ -1,3 +1,1001 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from datetime import datetime, timedelta, timezone as dt_timezone
+from rest_framework.views import APIView
+
+from common.renderers import (
+    JSON_BACKEND,
+    FastJSONRenderer,
+    dumps,
+    stdlib_dumps,
+)
+
+from .models import (
+    AggregatorLog,
+    Bank,
+    Currency,
+    LatestRate,
+    Record,
+    RecordDaily,
+)
+from .services.archive import open_archives
+from .services.currencies import (
+    SNAPSHOT_CACHE_KEY,
+    build_bank_currencies,
+    get_snapshot,
+    publish_snapshot,
+)
+from .services.events import publish_rate_changes
+
+
+class RateTestMixin:
+    def setUp(self):
+        cache.clear()
+
+    def create_bank(self, name):
+        return Bank.objects.create(name=name, logo=f'{name.lower()}.png')
+
+    def create_currency(self, code):
+        return Currency.objects.create(name=f'{code} currency',
+                                       country=f'{code} country',
+                                       short_name=code)
+
+    def create_rates(self, bank, currency, buy, sell):
+        Record.objects.create(bank=bank, currency=currency,
+                              type='buy', value=buy)
+        Record.objects.create(bank=bank, currency=currency,
+                              type='sell', value=sell)
+
+    def rebuild_latest_rates(self):
+        call_command('rebuild_latest_rates', stdout=StringIO())
+
+    def rebuild_rollups(self):
+        call_command('rebuild_rollups', stdout=StringIO())
+
+
+class RebuildLatestRatesCommandTests(RateTestMixin, TestCase):
+    def test_keeps_only_the_newest_record_per_type(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.create_rates(bank, usd, '129.50', '132.25')
+        LatestRate.objects.create(bank=bank, currency=usd,
+                                  type='buy', value='1.00')
+
+        self.rebuild_latest_rates()
+
+        rates = {rate.type: rate for rate in LatestRate.objects.all()}
+        self.assertEqual(len(rates), 2)
+        self.assertEqual(str(rates['buy'].value), '129.50')
+        self.assertEqual(str(rates['sell'].value), '132.25')
+        self.assertEqual(rates['sell'].record,
+                         Record.objects.filter(type='sell').last())
+
+
+class BenchmarkRecordsCommandTests(RateTestMixin, TransactionTestCase):
+    def test_requires_confirmation(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_records', stdout=StringIO())
+
+    def test_deletes_synthetic_records(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        real_ids = list(Record.objects.values_list('id', flat=True))
+
+        call_command('benchmark_records', rows=50, repeat=2,
+                     yes_destroy=True, stdout=StringIO())
+
+        self.assertEqual(list(Record.objects.values_list('id', flat=True)),
+                         real_ids)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Record._meta.db_table)
+        self.assertIn('record_latest_idx', indexes)
+
+
+class BankCurrencyListViewTests(RateTestMixin, TestCase):
+    def test_returns_latest_buy_and_sell_per_currency(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.create_rates(bank, usd, '129.50', '132.25')
+        self.rebuild_latest_rates()
+
+        response = self.client.get(reverse('bank_list'))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['name'], 'NCBA')
+        currencies = data[0]['currencies']
+        self.assertEqual(len(currencies), 1)
+        self.assertEqual(currencies[0]['short_name'], 'USD')
+        self.assertEqual(currencies[0]['buy']['value'], '129.50')
+        self.assertEqual(currencies[0]['sell']['value'], '132.25')
+
+    def test_bank_without_records_has_no_currencies(self):
+        self.create_bank('Empty')
+
+        data = self.client.get(reverse('bank_list')).json()
+
+        self.assertEqual(data[0]['currencies'], [])
+
+    def test_serves_published_snapshot_without_queries(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('bank_list'))
+
+        self.assertEqual(response['X-Data-Version'],
+                         str(Record.objects.last().id))
+        self.assertEqual(response.json(), build_bank_currencies())
+
+    def test_snapshot_changes_only_when_republished(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+        LatestRate.objects.filter(type='buy').update(value='140.00')
+
+        stale = self.client.get(reverse('bank_list')).json()
+        publish_snapshot()
+        fresh = self.client.get(reverse('bank_list')).json()
+
+        self.assertEqual(stale[0]['currencies'][0]['buy']['value'], '128.00')
+        self.assertEqual(fresh[0]['currencies'][0]['buy']['value'], '140.00')
+
+    def test_picks_up_records_published_by_another_process(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+        stale = cache.get(SNAPSHOT_CACHE_KEY)
+
+        # A scrape process publishes into its own, separate cache
+        self.create_rates(bank, usd, '129.00', '132.00')
+        self.rebuild_latest_rates()
+        cache.set(SNAPSHOT_CACHE_KEY, stale)
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('bank_list'))
+        later = time.monotonic() + 5
+        with mock.patch('domain.services.currencies.time.monotonic',
+                        return_value=later):
+            response = self.client.get(reverse('bank_list'))
+            with self.assertNumQueries(0):
+                self.client.get(reverse('bank_list'))
+
+        self.assertEqual(response['X-Data-Version'],
+                         str(Record.objects.last().id))
+        self.assertEqual(
+            response.json()[0]['currencies'][0]['buy']['value'], '129.00')
+
+    @override_settings(CURRENCIES_SNAPSHOT_CHECK_INTERVAL=0)
+    def test_picks_up_changes_that_add_no_records(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.client.get(reverse('bank_list'))
+
+        # e.g. rebuild_latest_rates in another process, then an admin edit
+        LatestRate.objects.create(bank=bank, currency=usd,
+                                  type='buy', value='128.00')
+        bank.name = 'NCBA Bank'
+        bank.save()
+        response = self.client.get(reverse('bank_list'))
+
+        self.assertEqual(response['X-Data-Version'], '0')
+        self.assertEqual(response.json()[0]['name'], 'NCBA Bank')
+        self.assertEqual(
+            response.json()[0]['currencies'][0]['buy']['value'], '128.00')
+
+    def test_publishes_on_first_request(self):
+        self.create_bank('NCBA')
+
+        response = self.client.get(reverse('bank_list'))
+
+        self.assertEqual(response['X-Data-Version'], '0')
+        self.assertEqual(response.json()[0]['currencies'], [])
+
+    def test_picks_up_snapshot_file_written_by_another_process(self):
+        self.create_bank('NCBA')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'currencies.json')
+            with override_settings(CURRENCIES_SNAPSHOT_FILE=path):
+                publish_snapshot()
+                # Simulate a process that never saw the cache entry
+                cache.clear()
+
+                with self.assertNumQueries(0):
+                    snapshot = get_snapshot()
+
+        self.assertEqual(snapshot['version'], 0)
+        self.assertEqual(snapshot['body'], b'[{"id":%d,"name":"NCBA",'
+                         b'"logo":"/media/ncba.png","currencies":[]}]'
+                         % Bank.objects.get().id)
+
+    def test_if_none_match_returns_not_modified(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+        etag = self.client.get(reverse('bank_list'))['ETag']
+
+        response = self.client.get(reverse('bank_list'),
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_returns_not_modified(self):
+        bank = self.create_bank('NCBA')
+        bank.last_checked = timezone.now()
+        bank.save()
+        last_modified = self.client.get(
+            reverse('bank_list'))['Last-Modified']
+
+        response = self.client.get(reverse('bank_list'),
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_data_changes_etag(self):
+        bank = self.create_bank('NCBA')
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+        etag = self.client.get(reverse('bank_list'))['ETag']
+
+        self.create_rates(bank, usd, '129.00', '132.00')
+        self.rebuild_latest_rates()
+        response = self.client.get(reverse('bank_list'),
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class BankCurrencyFilterTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ncba = self.create_bank('NCBA')
+        self.other = self.create_bank('Other')
+        usd = self.create_currency('USD')
+        eur = self.create_currency('EUR')
+        self.create_rates(self.ncba, usd, '128.00', '131.00')
+        self.create_rates(self.ncba, eur, '140.00', '143.00')
+        self.create_rates(self.other, usd, '127.50', '130.00')
+        self.rebuild_latest_rates()
+
+    def get(self, **params):
+        return self.client.get(reverse('bank_list'), params)
+
+    def test_filters_banks_and_currencies(self):
+        data = self.get(bank=f'{self.ncba.id}', currency='eur').json()
+
+        self.assertEqual([bank['name'] for bank in data], ['NCBA'])
+        self.assertEqual(
+            [currency['short_name'] for currency in data[0]['currencies']],
+            ['EUR'])
+        self.assertEqual(data[0]['currencies'][0]['sell']['value'],
+                         '143.00')
+
+    def test_projects_requested_fields(self):
+        record_ids = dict(LatestRate.objects.filter(
+            currency__short_name='USD', type='buy').values_list(
+                'bank_id', 'record_id'))
+
+        data = self.get(currency='USD', bank_fields='name',
+                        fields='short_name,buy').json()
+
+        self.assertEqual(data, [
+            {'name': 'NCBA', 'currencies': [
+                {'short_name': 'USD',
+                 'buy': {'id': record_ids[self.ncba.id], 'value': '128.00'}}
+            ]},
+            {'name': 'Other', 'currencies': [
+                {'short_name': 'USD',
+                 'buy': {'id': record_ids[self.other.id], 'value': '127.50'}}
+            ]},
+        ])
+        self.assertEqual(
+            self.get(bank=self.other.id, bank_fields='id',
+                     fields='buy').json(),
+            [{'id': self.other.id, 'currencies': [
+                {'buy': {'id': record_ids[self.other.id],
+                         'value': '127.50'}}]}])
+
+    def test_filters_are_applied_in_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(bank=self.other.id, currency='USD', bank_fields='id',
+                     fields='short_name,sell')
+
+        rates_sql, banks_sql = [query['sql'] for query in queries]
+        self.assertIn('"short_name" IN', rates_sql)
+        self.assertIn("'sell'", rates_sql)
+        self.assertNotIn('"country_flag"', rates_sql)
+        self.assertNotIn('"logo"', banks_sql)
+        self.assertIn('IN (%d)' % self.other.id, banks_sql)
+
+    def test_unfiltered_listing_matches_snapshot(self):
+        self.assertEqual(self.get(bank_fields='id,name,logo').json(),
+                         self.get().json())
+
+    def test_unknown_field(self):
+        self.assertEqual(self.get(fields='value').status_code, 400)
+        self.assertEqual(self.get(bank='NCBA').status_code, 400)
+        self.assertEqual(self.get(bank='9' * 23).status_code, 400)
+        self.assertEqual(self.get(bank='0').status_code, 400)
+
+    async def test_async_view_applies_the_same_filters(self):
+        for params in ({'currency': 'USD', 'fields': 'short_name,buy'},
+                       {'bank': self.ncba.id, 'bank_fields': 'id'},
+                       {'bank': '9' * 23}):
+            expected = await sync_to_async(self.get)(**params)
+            response = await self.async_client.get(
+                reverse('async_bank_list'), params)
+
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.content, expected.content)
+
+
+class BankCurrencyChangesViewTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bank = self.create_bank('NCBA')
+        self.usd = self.create_currency('USD')
+        self.eur = self.create_currency('EUR')
+        self.create_rates(self.bank, self.usd, '128.00', '131.00')
+        self.create_rates(self.bank, self.eur, '140.00', '143.00')
+        self.rebuild_latest_rates()
+
+    def changes(self, since):
+        return self.client.get(reverse('bank_changes'),
+                               {'since': since}).json()
+
+    def test_returns_only_rates_changed_since_version(self):
+        version = self.changes(0)['version']
+        self.assertEqual(len(self.changes(0)['changes']), 4)
+
+        self.create_rates(self.bank, self.usd, '128.50', '131.00')
+        self.rebuild_latest_rates()
+        data = self.changes(version)
+
+        self.assertEqual(data['version'], Record.objects.last().id)
+        self.assertEqual(
+            [(change['short_name'], change['type'], change['value'])
+             for change in data['changes']],
+            [('USD', 'buy', '128.50'), ('USD', 'sell', '131.00')])
+        self.assertEqual(data['version'],
+                         int(self.client.get(
+                             reverse('bank_list'))['X-Data-Version']))
+
+    def test_up_to_date_client_gets_no_changes_without_queries(self):
+        version = self.changes(0)['version']
+
+        with self.assertNumQueries(0):
+            data = self.changes(version)
+
+        self.assertEqual(data, {'version': version, 'changes': []})
+
+    def test_since_is_required(self):
+        response = self.client.get(reverse('bank_changes'), {'since': 'x'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class FastJSONRendererTests(TestCase):
+    data = {
+        'value': Decimal('129.50'),
+        'time': datetime(2024, 10, 17, 9, 30, tzinfo=dt_timezone.utc),
+        'name': 'Kenyan Shilling – KES',
+        'rates': [1, None, True],
+    }
+
+    def test_matches_stdlib_encoding(self):
+        self.assertEqual(json.loads(FastJSONRenderer().render(self.data)),
+                         json.loads(stdlib_dumps(self.data)))
+        self.assertEqual(json.loads(dumps(self.data))['time'],
+                         '2024-10-17T09:30:00Z')
+        self.assertEqual(json.loads(dumps(self.data))['value'], '129.50')
+
+    def test_falls_back_to_drf_encoding(self):
+        cases = [
+            (gettext_lazy('Not found.'), 'Not found.'),
+            ({'USD'}, ['USD']),
+            (timedelta(minutes=1, milliseconds=500), '60.5'),
+            ({1: ['Not a valid string.']}, {'1': ['Not a valid string.']}),
+            (2 ** 70, 2 ** 70),
+        ]
+
+        for value, expected in cases:
+            with self.subTest(value=value):
+                data = {'value': value}
+                self.assertEqual(
+                    json.loads(FastJSONRenderer().render(data)),
+                    {'value': expected})
+                self.assertEqual(json.loads(stdlib_dumps(data)),
+                                 {'value': expected})
+
+    def test_is_the_default_drf_renderer(self):
+        self.assertIsInstance(APIView().get_renderers()[0],
+                              FastJSONRenderer)
+
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command('benchmark_json', banks=2, repeat=1, stdout=stdout)
+
+        self.assertIn(JSON_BACKEND, stdout.getvalue())
+
+
+class BuildBankCurrenciesTests(RateTestMixin, TestCase):
+    def test_query_count_does_not_grow_with_data(self):
+        currencies = [self.create_currency(code)
+                      for code in ('USD', 'EUR', 'GBP', 'JPY')]
+        for name in ('A', 'B', 'C'):
+            bank = self.create_bank(name)
+            for currency in currencies:
+                self.create_rates(bank, currency, '1.00', '2.00')
+        self.rebuild_latest_rates()
+
+        with self.assertNumQueries(2):
+            small = build_bank_currencies()
+
+        for name in ('D', 'E', 'F', 'G'):
+            bank = self.create_bank(name)
+            for currency in currencies:
+                self.create_rates(bank, currency, '1.00', '2.00')
+                self.create_rates(bank, currency, '1.50', '2.50')
+        self.rebuild_latest_rates()
+
+        with self.assertNumQueries(2):
+            large = build_bank_currencies()
+
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(large), 7)
+        self.assertEqual(large[-1]['currencies'][0]['buy']['value'], '1.50')
+
+
+class ConvertViewTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ncba = self.create_bank('NCBA')
+        self.other = self.create_bank('Other')
+        usd = self.create_currency('USD')
+        eur = self.create_currency('EUR')
+        self.create_rates(self.ncba, usd, '128.00', '130.00')
+        self.create_rates(self.ncba, eur, '140.00', '143.36')
+        self.create_rates(self.other, usd, '127.00', '131.00')
+        self.rebuild_latest_rates()
+
+    def convert(self, **params):
+        return self.client.get(reverse('convert'), params)
+
+    def test_cross_rate_goes_through_kes(self):
+        data = self.convert(**{'from': 'USD', 'to': 'EUR', 'amount': '100',
+                               'bank': self.ncba.id}).json()
+
+        self.assertEqual(data['results'], [{
+            'bank_id': self.ncba.id,
+            'bank_name': 'NCBA',
+            'rate': '0.8929',
+            'amount': '89.29',
+        }])
+
+    def test_kes_on_either_side(self):
+        to_kes = self.convert(**{'from': 'USD', 'to': 'KES',
+                                 'bank': self.ncba.id}).json()
+        from_kes = self.convert(**{'from': 'KES', 'to': 'USD',
+                                   'amount': '1300',
+                                   'bank': self.ncba.id}).json()
+
+        self.assertEqual(to_kes['results'][0]['amount'], '128.00')
+        self.assertEqual(from_kes['results'][0]['amount'], '10.00')
+
+    def test_without_bank_lists_every_bank_with_both_rates(self):
+        data = self.convert(**{'from': 'USD', 'to': 'KES'}).json()
+        cross = self.convert(**{'from': 'USD', 'to': 'EUR'}).json()
+
+        self.assertEqual([result['bank_name'] for result in data['results']],
+                         ['NCBA', 'Other'])
+        self.assertEqual([result['bank_name'] for result in cross['results']],
+                         ['NCBA'])
+
+    def test_conversions_do_not_query_once_matrix_is_built(self):
+        self.convert(**{'from': 'USD', 'to': 'EUR'})
+
+        with self.assertNumQueries(0):
+            response = self.convert(**{'from': 'EUR', 'to': 'USD'})
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_matrix_is_rebuilt_when_data_changes(self):
+        self.convert(**{'from': 'USD', 'to': 'KES'})
+        self.create_rates(self.ncba, Currency.objects.get(short_name='USD'),
+                          '129.00', '130.00')
+        self.rebuild_latest_rates()
+
+        data = self.convert(**{'from': 'USD', 'to': 'KES',
+                               'bank': self.ncba.id}).json()
+
+        self.assertEqual(data['results'][0]['rate'], '129.0000')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(
+            self.convert(**{'from': 'XXX', 'to': 'USD'}).status_code, 400)
+        self.assertEqual(
+            self.convert(**{'from': 'USD', 'to': 'EUR',
+                            'amount': 'lots'}).status_code, 400)
+        self.assertEqual(
+            self.convert(**{'from': 'USD', 'to': 'EUR',
+                            'bank': '999'}).status_code, 400)
+
+    def test_large_amounts_keep_every_digit(self):
+        data = self.convert(**{'from': 'USD', 'to': 'KES',
+                               'amount': '100000000000000000000001',
+                               'bank': self.ncba.id}).json()
+
+        self.assertEqual(data['results'][0]['amount'],
+                         '12800000000000000000000128.00')
+
+    def test_non_finite_and_non_positive_amounts_are_rejected(self):
+        for amount in ('NaN', 'Infinity', '-inf', '1e400', '1e300', '0',
+                       '-100'):
+            response = self.convert(**{'from': 'USD', 'to': 'EUR',
+                                       'amount': amount})
+            self.assertEqual(response.status_code, 400, amount)
+
+    def test_non_positive_rates_are_treated_as_missing(self):
+        LatestRate.objects.filter(bank=self.other, type='sell').update(
+            value='0.00')
+        LatestRate.objects.filter(bank=self.other, type='buy').update(
+            value='-1.00')
+        publish_snapshot()
+
+        to_usd = self.convert(**{'from': 'KES', 'to': 'USD'}).json()
+        from_usd = self.convert(**{'from': 'USD', 'to': 'KES'}).json()
+
+        self.assertEqual([result['bank_name']
+                          for result in to_usd['results']], ['NCBA'])
+        self.assertEqual([result['bank_name']
+                          for result in from_usd['results']], ['NCBA'])
+
+
+class BestRatesViewTests(RateTestMixin, TestCase):
+    def test_picks_best_bank_per_currency_with_spread(self):
+        ncba = self.create_bank('NCBA')
+        other = self.create_bank('Other')
+        usd = self.create_currency('USD')
+        eur = self.create_currency('EUR')
+        self.create_rates(ncba, usd, '128.00', '131.00')
+        self.create_rates(other, usd, '127.50', '130.00')
+        Record.objects.create(bank=other, currency=eur,
+                              type='buy', value='140.00')
+        self.rebuild_latest_rates()
+
+        data = self.client.get(reverse('best_rates')).json()
+
+        self.assertEqual(data, [
+            {
+                'currency': 'EUR',
+                'best_buy': {'bank_id': other.id, 'bank_name': 'Other',
+                             'value': '140.00'},
+                'best_sell': None,
+                'spread': None,
+            },
+            {
+                'currency': 'USD',
+                'best_buy': {'bank_id': ncba.id, 'bank_name': 'NCBA',
+                             'value': '128.00'},
+                'best_sell': {'bank_id': other.id, 'bank_name': 'Other',
+                              'value': '130.00'},
+                'spread': {'min': '2.50', 'max': '3.00', 'mean': '2.75',
+                           'banks': 2},
+            },
+        ])
+
+    def test_empty_without_rates(self):
+        self.assertEqual(self.client.get(reverse('best_rates')).json(), [])
+
+
+class HistoryViewTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bank = self.create_bank('NCBA')
+        self.usd = self.create_currency('USD')
+
+    def create_record(self, value, hour, minute, day=17, type='buy'):
+        record = Record.objects.create(bank=self.bank, currency=self.usd,
+                                       type=type, value=value)
+        created_at = datetime(2026, 10, day, hour, minute,
+                              tzinfo=dt_timezone.utc)
+        Record.objects.filter(pk=record.pk).update(created_at=created_at)
+
+    def history(self, **params):
+        self.rebuild_rollups()
+        params = {'bank': self.bank.id, 'currency': 'usd', 'type': 'buy',
+                  'start': '2026-10-17', 'end': '2026-10-19', **params}
+        return self.client.get(reverse('history'), {
+            key: value for key, value in params.items() if value is not None})
+
+    def test_hourly_ohlc_points(self):
+        self.create_record('128.00', 9, 0)
+        self.create_record('129.50', 9, 20)
+        self.create_record('127.75', 9, 40)
+        self.create_record('128.25', 9, 50)
+        self.create_record('130.00', 10, 5)
+        self.create_record('150.00', 10, 10, type='sell')
+
+        data = self.history(interval='1h').json()
+
+        self.assertEqual(data['points'], [
+            {'time': '2026-10-17T09:00:00Z', 'open': '128.00',
+             'high': '129.50', 'low': '127.75', 'close': '128.25',
+             'count': 4},
+            {'time': '2026-10-17T10:00:00Z', 'open': '130.00',
+             'high': '130.00', 'low': '130.00', 'close': '130.00',
+             'count': 1},
+        ])
+
+    def test_daily_points_respect_range(self):
+        self.create_record('128.00', 9, 0)
+        self.create_record('129.00', 12, 0, day=18)
+        self.create_record('131.00', 12, 0, day=20)
+
+        data = self.history(interval='1d').json()
+
+        self.assertEqual([point['time'] for point in data['points']],
+                         ['2026-10-17T00:00:00Z', '2026-10-18T00:00:00Z'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.history(interval='5m').status_code, 400)
+        self.assertEqual(self.history(type='hold').status_code, 400)
+        self.assertEqual(self.history(start='yesterday').status_code, 400)
+        for params in [{'currency': None}, {'currency': ' '},
+                       {'bank': None}, {'bank': '1,2'},
+                       {'bank': str(2 ** 63)}]:
+            self.assertEqual(self.history(**params).status_code, 400,
+                             params)
+
+    def test_reads_only_the_rollup_table(self):
+        self.create_record('128.00', 9, 0)
+        self.rebuild_rollups()
+
+        with self.assertNumQueries(1):
+            self.client.get(reverse('history'), {
+                'bank': self.bank.id, 'currency': 'USD', 'type': 'buy',
+                'start': '2026-10-17', 'end': '2026-10-19'})
+
+
+class CompactHistoryCommandTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bank = self.create_bank('NCBA')
+        self.usd = self.create_currency('USD')
+
+    def create_record(self, value, days_ago, type='buy'):
+        record = Record.objects.create(bank=self.bank, currency=self.usd,
+                                       type=type, value=value)
+        Record.objects.filter(pk=record.pk).update(
+            created_at=timezone.now() - timedelta(days=days_ago))
+        return record
+
+    def compact(self, **options):
+        call_command('compact_history', batch_size=2, stdout=StringIO(),
+                     **options)
+
+    def test_deletes_old_records_captured_in_rollups(self):
+        for days_ago in (200, 150, 120):
+            self.create_record('128.00', days_ago)
+        recent = self.create_record('129.00', 10)
+        self.rebuild_rollups()
+        self.rebuild_latest_rates()
+        old_log = AggregatorLog.objects.create(bank=self.bank, type='scrape',
+                                               status='success')
+        AggregatorLog.objects.filter(pk=old_log.pk).update(
+            created_at=timezone.now() - timedelta(days=200))
+        AggregatorLog.objects.create(bank=self.bank, type='scrape',
+                                     status='success')
+
+        self.compact(days=90)
+
+        self.assertEqual(list(Record.objects.all()), [recent])
+        self.assertEqual(AggregatorLog.objects.count(), 1)
+        self.assertEqual(RecordDaily.objects.count(), 4)
+
+    def test_rebuild_after_compaction_keeps_pruned_buckets(self):
+        for days_ago in (200, 150):
+            self.create_record('128.00', days_ago)
+        self.create_record('126.00', 150)
+        self.create_record('129.00', 10)
+        self.rebuild_rollups()
+        self.rebuild_latest_rates()
+        daily = list(RecordDaily.objects.order_by('bucket').values_list(
+            'bucket', 'open', 'low', 'close', 'count'))
+
+        self.compact(days=90)
+        self.rebuild_rollups()
+
+        self.assertEqual(Record.objects.count(), 1)
+        self.assertEqual(list(RecordDaily.objects.order_by('bucket')
+                              .values_list('bucket', 'open', 'low', 'close',
+                                           'count')), daily)
+        self.assertEqual(
+            list(RecordDaily.objects.values_list('compacted', flat=True)),
+            [True, True, False])
+
+    def test_keeps_records_missing_from_rollups(self):
+        self.create_record('128.00', 200)
+
+        self.compact(days=90)
+
+        self.assertEqual(Record.objects.count(), 1)
+
+    def test_keeps_records_backing_latest_rates(self):
+        sell = self.create_record('131.00', 200, type='sell')
+        self.create_record('128.00', 200)
+        self.create_record('129.00', 10)
+        self.rebuild_rollups()
+        self.rebuild_latest_rates()
+
+        self.compact(days=90)
+
+        self.assertEqual(Record.objects.filter(type='sell').get(), sell)
+        self.assertEqual(Record.objects.filter(type='buy').count(), 1)
+
+
+class ExportTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ncba = self.create_bank('NCBA')
+        self.other = self.create_bank('Other')
+        self.usd = self.create_currency('USD')
+        self.eur = self.create_currency('EUR')
+        self.create_rates(self.ncba, self.usd, '128.00', '131.00')
+        self.create_rates(self.ncba, self.eur, '140.00', '143.00')
+        self.create_rates(self.other, self.usd, '127.50', '130.00')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export'), params)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        return b''.join(response.streaming_content).decode()
+
+    def test_streams_csv_with_names(self):
+        lines = self.export(bank=self.ncba.id, currency='usd').splitlines()
+
+        self.assertEqual(lines[0], 'id,created_at,bank,currency,type,value')
+        self.assertEqual([line.split(',')[2:] for line in lines[1:]],
+                         [['NCBA', 'USD', 'buy', '128.00'],
+                          ['NCBA', 'USD', 'sell', '131.00']])
+
+    def test_streams_ndjson(self):
+        rows = [json.loads(line) for line in self.export(
+            output='ndjson', bank=f'{self.ncba.id},{self.other.id}',
+            currency='USD').splitlines()]
+
+        self.assertEqual([(row['bank'], row['type'], row['value'])
+                          for row in rows],
+                         [('NCBA', 'buy', '128.00'),
+                          ('NCBA', 'sell', '131.00'),
+                          ('Other', 'buy', '127.50'),
+                          ('Other', 'sell', '130.00')])
+
+    def test_date_filters(self):
+        self.assertEqual(len(self.export(start='2000-01-01').splitlines()),
+                         7)
+        self.assertEqual(len(self.export(end='2000-01-01').splitlines()), 1)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(
+            reverse('export'), {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            reverse('export'), {'bank': 'NCBA'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            reverse('export'), {'bank': '9' * 23}).status_code, 400)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        response = await self.async_client.get(
+            reverse('export'), {'output': 'ndjson', 'currency': 'EUR'})
+
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual([json.loads(line)['value'] for line in lines],
+                         ['140.00', '143.00'])
+
+    def test_command_writes_same_rows(self):
+        stdout = StringIO()
+        call_command('export_records', format='ndjson', currency=['eur'],
+                     stdout=stdout)
+
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([row['value'] for row in rows],
+                         ['140.00', '143.00'])
+
+
+class ArchiveTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ncba = self.create_bank('NCBA')
+        self.other = self.create_bank('Other')
+        usd = self.create_currency('USD')
+        eur = self.create_currency('EUR')
+        self.create_rates(self.ncba, usd, '128.00', '131.05')
+        self.create_rates(self.other, eur, '140.10', '143.00')
+        self.create_rates(self.ncba, usd, '128.50', '131.00')
+        Record.objects.filter(bank=self.other).update(
+            created_at=timezone.now() - timedelta(days=62))
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def archive(self, *args):
+        stdout = StringIO()
+        call_command('archive_records', self.directory, *args,
+                     stdout=stdout)
+        return open_archives(self.directory)
+
+    def test_writes_one_archive_per_month(self):
+        archives = self.archive()
+
+        self.assertEqual(len(archives), 2)
+        self.assertEqual([len(archive) for archive in archives], [2, 4])
+        self.assertEqual(archives[0].meta['banks'], ['Other'])
+        self.assertIsInstance(archives[1]['value'], np.memmap)
+
+    def test_round_trips_values(self):
+        archive = self.archive(f'--month={timezone.now():%Y-%m}')[0]
+
+        mask = archive.mask(bank='NCBA', currency='USD', type='sell')
+        self.assertEqual(archive.values(mask).tolist(), [131.05, 131.0])
+        self.assertEqual(archive['value'].dtype, np.int64)
+        self.assertEqual(archive['bank'].dtype, np.int32)
+        self.assertEqual(len(archive.timestamps(mask)), 2)
+        self.assertFalse(archive.mask(bank='Missing').any())
+
+    def test_invalid_month(self):
+        with self.assertRaises(CommandError):
+            self.archive('--month=2024-13')
+
+
+class AsyncViewTests(RateTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        bank = self.create_bank('NCBA')
+        self.bank_id = bank.id
+        usd = self.create_currency('USD')
+        self.create_rates(bank, usd, '128.00', '131.00')
+        self.rebuild_latest_rates()
+        self.rebuild_rollups()
+
+    async def assert_matches_sync(self, name, params=None):
+        expected = await sync_to_async(self.client.get)(
+            reverse(name), params)
+        response = await self.async_client.get(
+            reverse(f'async_{name}'), params)
+
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    async def test_currencies(self):
+        response = await self.assert_matches_sync('bank_list')
+        self.assertIn('ETag', response)
+
+        response = await self.async_client.get(
+            reverse('async_bank_list'),
+            headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_convert(self):
+        await self.assert_matches_sync(
+            'convert', {'from': 'USD', 'to': 'KES', 'amount': '10'})
+        await self.assert_matches_sync('convert', {'from': 'XXX',
+                                                   'to': 'KES'})
+
+    async def test_best_rates(self):
+        await self.assert_matches_sync('best_rates')
+
+    async def test_history(self):
+        params = {'bank': self.bank_id, 'currency': 'usd', 'type': 'buy',
+                  'end': (timezone.now() + timedelta(days=1)).isoformat()}
+        response = await self.assert_matches_sync('history', params)
+        self.assertEqual(len(json.loads(response.content)['points']), 1)
+
+        await self.assert_matches_sync('history', {'interval': '1w'})
+
+
+class RateEventsViewTests(TestCase):
+    changes = [{'bank': 1, 'currency': 'USD', 'type': 'buy',
+                'old': '128.00', 'new': '128.40',
+                'timestamp': '2024-10-17T09:00:00+00:00'}]
+
+    def setUp(self):
+        cache.clear()
+
+    async def connect(self, **headers):
+        response = await self.async_client.get(reverse('rate_events'),
+                                               headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    async def test_pushes_published_changes(self):
+        stream = await self.connect()
+        self.assertEqual(await anext(stream), b'retry: 15000\n\n')
+
+        await sync_to_async(publish_rate_changes,
+                            thread_sensitive=False)(self.changes)
+
+        chunk = (await anext(stream)).decode()
+        self.assertRegex(chunk, r'^id: \d+\nevent: rates\ndata: ')
+        self.assertEqual(json.loads(chunk.split('data: ')[1]), self.changes)
+        await stream.aclose()
+
+    @override_settings(RATE_EVENTS_HEARTBEAT=0.01)
+    async def test_sends_keepalive_when_idle(self):
+        stream = await self.connect()
+        await anext(stream)
+
+        self.assertEqual(await anext(stream), b': keepalive\n\n')
+        await stream.aclose()
+
+    @override_settings(RATE_EVENTS_BROKER='cache',
+                       RATE_EVENTS_POLL_INTERVAL=0.01)
+    async def test_cache_broker_resumes_from_last_event_id(self):
+        first = await sync_to_async(publish_rate_changes)(self.changes)
+        await sync_to_async(publish_rate_changes)(self.changes)
+        self.assertIsNone(await sync_to_async(publish_rate_changes)([]))
+
+        stream = await self.connect(last_event_id=str(first - 1))
+        await anext(stream)
+
+        ids = [int(line.split()[1])
+               for chunk in [await anext(stream), await anext(stream)]
+               for line in chunk.decode().splitlines()
+               if line.startswith('id:')]
+        self.assertEqual(ids, [first, first + 1])
+        await stream.aclose()
+
+    @override_settings(RATE_EVENTS_BROKER='cache', RATE_EVENTS_QUEUE_SIZE=2,
+                       RATE_EVENTS_POLL_INTERVAL=0.01)
+    async def test_cache_broker_bounds_replay(self):
+        for _ in range(3):
+            last = await sync_to_async(publish_rate_changes)(self.changes)
+
+        stream = await self.connect(last_event_id='0')
+        await anext(stream)
+        ids = [int(line.split()[1])
+               for chunk in [await anext(stream), await anext(stream)]
+               for line in chunk.decode().splitlines()
+               if line.startswith('id:')]
+        self.assertEqual(ids, [last - 1, last])
+        await stream.aclose()
+
+        # A negative id is ignored instead of replaying from it
+        stream = await self.connect(last_event_id='-1000000000000')
+        await anext(stream)
+        new = await sync_to_async(publish_rate_changes)(self.changes)
+        self.assertTrue((await anext(stream)).startswith(b'id: %d\n' % new))
+        await stream.aclose()
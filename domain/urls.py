@@ -1,6 +1,31 @@
 from django.urls import path
-from .views import BankCurrencyListView
+from .views import (
+    AsyncBankCurrencyListView,
+    AsyncBestRatesView,
+    AsyncConvertView,
+    AsyncHistoryView,
+    BankCurrencyChangesView,
+    BankCurrencyListView,
+    BestRatesView,
+    ConvertView,
+    ExportView,
+    HistoryView,
+    RateEventsView,
+)
 
 urlpatterns = [
     path('currencies/', BankCurrencyListView.as_view(), name='bank_list'),
+    path('currencies/changes/', BankCurrencyChangesView.as_view(),
+         name='bank_changes'),
+    path('convert/', ConvertView.as_view(), name='convert'),
+    path('best-rates/', BestRatesView.as_view(), name='best_rates'),
+    path('history/', HistoryView.as_view(), name='history'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('async/currencies/', AsyncBankCurrencyListView.as_view(),
+         name='async_bank_list'),
+    path('async/convert/', AsyncConvertView.as_view(), name='async_convert'),
+    path('async/best-rates/', AsyncBestRatesView.as_view(),
+         name='async_best_rates'),
+    path('async/history/', AsyncHistoryView.as_view(), name='async_history'),
+    path('events/', RateEventsView.as_view(), name='rate_events'),
 ]
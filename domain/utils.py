@@ -0,0 +1,36 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_timestamp(value):
+    """Parse an ISO date or datetime into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        parsed = datetime.combine(date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def split_param(value):
+    """Split a comma separated query parameter, dropping blanks"""
+    return [item.strip() for item in (value or '').split(',')
+            if item.strip()]
+
+
+# Largest value a BigAutoField primary key can hold
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_ids(value):
+    """Parse comma separated ids, rejecting values no row can have"""
+    ids = [int(item) for item in split_param(value)]
+    for id in ids:
+        if not 0 < id <= MAX_ID:
+            raise ValueError(id)
+    return ids
@@ -1,6 +1,182 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
-from django.http import JsonResponse
-from .models import Bank, Record, Currency
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from common.renderers import FastJsonResponse, dumps
+from .models import TYPE_CHOICES
+from .services.currencies import (
+    BANK_FIELDS,
+    CURRENCY_FIELDS,
+    aget_snapshot,
+    build_bank_currencies,
+    get_changes_since,
+    get_snapshot,
+)
+from .services.events import get_broker
+from .services.export import EXPORT_FORMATS, get_export_queryset
+from .services.history import INTERVALS, aget_history, get_history
+from .services.rate_matrix import aget_rate_matrix, get_rate_matrix
+from .utils import parse_ids, parse_timestamp, split_param
+
+
+def snapshot_response(request, snapshot):
+    """
+    Answer a GET from a published snapshot, returning 304 Not Modified when
+    the client's If-None-Match / If-Modified-Since still match.
+    """
+    response = get_conditional_response(
+        request,
+        etag=snapshot['etag'],
+        last_modified=snapshot['last_modified'],
+    )
+    if response is None:
+        response = HttpResponse(snapshot['body'],
+                                content_type='application/json')
+    response['ETag'] = snapshot['etag']
+    if snapshot['last_modified'] is not None:
+        response['Last-Modified'] = http_date(snapshot['last_modified'])
+    response['X-Data-Version'] = snapshot['version']
+    return response
+
+
+CENTS = Decimal('0.01')
+
+
+def convert_response(request, matrix):
+    """Answer a ConvertView request from ``matrix``."""
+    from_code = request.GET.get('from', '').upper()
+    to_code = request.GET.get('to', '').upper()
+    try:
+        amount = Decimal(request.GET.get('amount', '1'))
+    except InvalidOperation:
+        return FastJsonResponse({'error': 'Invalid amount'}, status=400)
+    if not amount.is_finite() or amount <= 0:
+        return FastJsonResponse({'error': 'Invalid amount'}, status=400)
+
+    for code in (from_code, to_code):
+        if not matrix.has_currency(code):
+            return FastJsonResponse(
+                {'error': f"Unknown currency '{code}'"}, status=400)
+
+    rates = matrix.cross_rates(from_code, to_code)
+    bank_positions = range(len(matrix.bank_ids))
+    if 'bank' in request.GET:
+        try:
+            bank_positions = [
+                matrix.bank_index[int(request.GET['bank'])]]
+        except (KeyError, ValueError):
+            return FastJsonResponse({'error': 'Unknown bank'}, status=400)
+
+    results = []
+    for position in bank_positions:
+        rate = rates[position]
+        if np.isnan(rate):
+            continue
+        try:
+            # In Decimal so large amounts keep every digit
+            converted = (amount * Decimal(repr(float(rate)))).quantize(
+                CENTS)
+        except InvalidOperation:
+            # Too many digits to represent to the cent, such as 1e300
+            return FastJsonResponse({'error': 'Invalid amount'}, status=400)
+        results.append({
+            'bank_id': matrix.bank_ids[position],
+            'bank_name': matrix.bank_names[position],
+            'rate': f'{rate:.4f}',
+            'amount': str(converted),
+        })
+
+    return FastJsonResponse({
+        'from': from_code,
+        'to': to_code,
+        'amount': str(amount),
+        'results': results,
+    })
+
+
+def get_history_params(request):
+    """
+    Validate HistoryView query parameters, returning ``(params, None)``
+    with get_history keyword arguments or ``(None, error_response)``.
+    """
+    params = request.GET
+    interval = params.get('interval', '1d')
+    type = params.get('type')
+    if interval not in INTERVALS:
+        return None, FastJsonResponse({'error': 'Invalid interval'},
+                                      status=400)
+    if type not in dict(TYPE_CHOICES):
+        return None, FastJsonResponse({'error': 'Invalid type'},
+                                      status=400)
+    try:
+        bank_id, = parse_ids(params['bank'])
+        currency_code = params['currency'].strip().upper()
+        if not currency_code:
+            raise ValueError('currency')
+        end = (parse_timestamp(params['end']) if 'end' in params
+               else timezone.now())
+        start = (parse_timestamp(params['start']) if 'start' in params
+                 else end - timedelta(days=30))
+    except (KeyError, ValueError):
+        return None, FastJsonResponse(
+            {'error': 'bank, currency, start and end must be valid'},
+            status=400)
+    return {
+        'bank_id': bank_id,
+        'currency_code': currency_code,
+        'type': type,
+        'start': start,
+        'end': end,
+        'interval': interval,
+    }, None
+
+
+def get_listing_filters(request):
+    """
+    Validate BankCurrencyListView filters, returning ``(filters, None)``
+    with build_bank_currencies keyword arguments, ``(None, None)`` when
+    the request has none or ``(None, error_response)``.
+    """
+    params = request.GET
+    if not any(name in params for name in
+               ('bank', 'currency', 'bank_fields', 'fields')):
+        return None, None
+
+    bank_fields = split_param(params.get('bank_fields'))
+    fields = split_param(params.get('fields'))
+    if (set(bank_fields) - set(BANK_FIELDS)
+            or set(fields) - set(CURRENCY_FIELDS)):
+        return None, FastJsonResponse({'error': 'Unknown field'},
+                                      status=400)
+    try:
+        bank_ids = parse_ids(params.get('bank'))
+    except ValueError:
+        return None, FastJsonResponse({'error': 'Invalid bank'}, status=400)
+    return {
+        'bank_ids': bank_ids,
+        'currency_codes': [code.upper() for code
+                           in split_param(params.get('currency'))],
+        'bank_fields': bank_fields,
+        'fields': fields,
+    }, None
+
+
+def history_payload(params, points):
+    return {
+        'bank': params['bank_id'],
+        'currency': params['currency_code'],
+        'type': params['type'],
+        'interval': params['interval'],
+        'points': points,
+    }
 
 
 class BankCurrencyListView(APIView):
@@ -13,6 +189,12 @@ class BankCurrencyListView(APIView):
         records. This API delivers data in JSON format and is built using
           Django Rest Framework (DRF).
 
+        The body is rendered once after each scrape and served from the
+        cache; the ``X-Data-Version`` header carries the version it was
+        rendered at. Responses include ``ETag`` and ``Last-Modified``, and
+        requests sending a matching ``If-None-Match`` or
+        ``If-Modified-Since`` get an empty ``304 Not Modified``.
+
         Overview
         --------
 
@@ -115,6 +297,24 @@ class BankCurrencyListView(APIView):
                 }
             ]
 
+        Filtering
+        ---------
+
+        Clients that only need part of the listing can narrow it; the
+        filters are applied in the database query and bypass the
+        pre-rendered body:
+
+        - **bank**: Comma separated bank ids
+        - **currency**: Comma separated currency short names
+        - **bank_fields**: Bank keys to return out of ``id``, ``name``
+          and ``logo``; ``currencies`` is always included
+        - **fields**: Currency keys to return out of ``id``, ``name``,
+          ``short_name``, ``country_flag``, ``buy`` and ``sell``
+
+        For example
+        ``/domain/currencies/?currency=USD&bank_fields=id&fields=buy``
+        returns only each bank's id and its USD buy rate.
+
         How to Use
         ----------
 
@@ -130,6 +330,8 @@ class BankCurrencyListView(APIView):
         - **Bank**: Represents a financial institution.
         - **Currency**: Represents a currency with a country flag.
         - **Record**: Represents a transaction record for buy or sell actions.
+        - **LatestRate**: Current buy or sell value per bank and currency,
+          maintained as records are collected.
         - **AggregatorLog**: Logs for tracking the status of transactions.
 
         Example Python Code for API Request
@@ -151,51 +353,371 @@ class BankCurrencyListView(APIView):
 
     """
     def get(self, request, *args, **kwargs):
-        banks = Bank.objects.all()
-        response_data = []
-
-        for bank in banks:
-            bank_data = {
-                'id': bank.id,
-                'name': bank.name,
-                'logo': bank.logo.url if bank.logo else None,
-                'currencies': []
+        filters, error = get_listing_filters(request)
+        if error:
+            return error
+        if filters is None:
+            # Serve the body rendered after the last scrape as-is
+            return snapshot_response(request, get_snapshot())
+        return FastJsonResponse(build_bank_currencies(**filters))
+
+
+class BankCurrencyChangesView(APIView):
+    """
+        Currency Changes API
+        ====================
+
+        Incremental sync for clients holding a copy of
+        ``/domain/currencies/``: returns only the buy and sell rates that
+        changed after the client's last version, plus the version to send
+        on the next sync. Versions are Record ids and match the
+        ``X-Data-Version`` header of the full listing.
+
+        Endpoint
+        --------
+
+        .. http:get:: /domain/currencies/changes/?since=41
+
+        - **since**: Version from the previous sync (required); ``0``
+          returns every current rate
+
+        Example JSON Response
+        ---------------------
+
+        .. code-block:: json
+
+            {
+                "version": 42,
+                "changes": [
+                    {
+                        "id": 42,
+                        "bank": 1,
+                        "currency": 1,
+                        "short_name": "USD",
+                        "type": "buy",
+                        "value": "128.40"
+                    }
+                ]
             }
 
-            currencies = Currency.objects.filter(records__bank=bank).distinct()
+        ``id`` is the Record id, as in the ``buy``/``sell`` objects of the
+        full listing. A client already at the latest version gets an empty
+        list without a database query. New banks and currencies are not
+        included; fetch the full listing to pick them up.
+    """
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET['since'])
+        except (KeyError, ValueError):
+            return FastJsonResponse({'error': 'since must be a version'},
+                                    status=400)
 
-            for currency in currencies:
-                currency_data = {
-                    'id': currency.id,
-                    'name': currency.name,
-                    'short_name': currency.short_name,
-                    'country_flag': currency.country_flag.url if currency.country_flag else None, # noqa
-                    'buy': None,
-                    'sell': None
-                }
+        version, changes = get_changes_since(
+            since, get_snapshot()['version'])
+        return FastJsonResponse({'version': version, 'changes': changes})
 
-                # Get buy and sell records for the currency
-                buy_record = Record.objects.filter(bank=bank,
-                                                   currency=currency,
-                                                   type='buy').last()
-                sell_record = Record.objects.filter(bank=bank,
-                                                    currency=currency,
-                                                    type='sell').last()
-
-                if buy_record:
-                    currency_data['buy'] = {
-                        'id': buy_record.id,
-                        'value': str(buy_record.value)
+
+class ConvertView(APIView):
+    """
+        Currency Conversion API
+        =======================
+
+        Converts an amount between two currencies using each bank's latest
+        rates. Rates are quoted in KES, so cross rates go through KES: the
+        bank buys ``from`` at its buy rate and sells ``to`` at its sell
+        rate. Either side may be ``KES``.
+
+        Endpoint
+        --------
+
+        .. http:get:: /domain/convert/?from=USD&to=EUR&amount=100&bank=1
+
+        - **from**, **to**: Currency short names (required)
+        - **amount**: Positive amount of ``from`` to convert (default 1)
+        - **bank**: Bank id; omit to convert at every bank with both rates
+
+        Example JSON Response
+        ---------------------
+
+        .. code-block:: json
+
+            {
+                "from": "USD",
+                "to": "EUR",
+                "amount": "100",
+                "results": [
+                    {
+                        "bank_id": 1,
+                        "bank_name": "NCBA",
+                        "rate": "0.8926",
+                        "amount": "89.26"
                     }
+                ]
+            }
 
-                if sell_record:
-                    currency_data['sell'] = {
-                        'id': sell_record.id,
-                        'value': str(sell_record.value)
+        Unknown currencies or banks and invalid amounts return 400.
+    """
+    def get(self, request, *args, **kwargs):
+        return convert_response(request, get_rate_matrix())
+
+
+class BestRatesView(APIView):
+    """
+        Best Rates API
+        ==============
+
+        For every currency, returns the bank paying the most when buying it
+        from customers (highest buy rate) and the bank charging the least
+        when selling it (lowest sell rate), plus statistics of the
+        sell - buy spread across banks quoting both.
+
+        Endpoint
+        --------
+
+        .. http:get:: /domain/best-rates/
+
+        Example JSON Response
+        ---------------------
+
+        .. code-block:: json
+
+            [
+                {
+                    "currency": "USD",
+                    "best_buy": {
+                        "bank_id": 1,
+                        "bank_name": "NCBA",
+                        "value": "128.40"
+                    },
+                    "best_sell": {
+                        "bank_id": 2,
+                        "bank_name": "Bank B",
+                        "value": "130.90"
+                    },
+                    "spread": {
+                        "min": "2.50",
+                        "max": "3.20",
+                        "mean": "2.85",
+                        "banks": 2
+                    }
+                }
+            ]
+    """
+    def get(self, request, *args, **kwargs):
+        return FastJsonResponse(get_rate_matrix().best_rates())
+
+
+class HistoryView(APIView):
+    """
+        Rate History API
+        ================
+
+        Returns the history of one bank's buy or sell rate for a currency
+        as open/high/low/close points, read from the hourly or daily
+        rollup tables.
+
+        Endpoint
+        --------
+
+        .. http:get:: /domain/history/?bank=1&currency=USD&type=buy&interval=1d
+
+        - **bank**: Bank id (required)
+        - **currency**: Currency short name (required)
+        - **type**: ``buy`` or ``sell`` (required)
+        - **start**, **end**: ISO date or datetime; default to the 30 days
+          before now
+        - **interval**: ``1h`` or ``1d`` (default ``1d``)
+
+        Example JSON Response
+        ---------------------
+
+        .. code-block:: json
+
+            {
+                "bank": 1,
+                "currency": "USD",
+                "type": "buy",
+                "interval": "1d",
+                "points": [
+                    {
+                        "time": "2024-10-17T00:00:00Z",
+                        "open": "128.40",
+                        "high": "129.10",
+                        "low": "128.20",
+                        "close": "128.90",
+                        "count": 24
                     }
+                ]
+            }
+    """
+    def get(self, request, *args, **kwargs):
+        params, error = get_history_params(request)
+        if error:
+            return error
+        return FastJsonResponse(history_payload(
+            params, get_history(**params)))
+
+
+class ExportView(APIView):
+    """
+        Record Export API
+        =================
+
+        Streams raw rate records, joined with bank and currency names, as
+        CSV or newline-delimited JSON. Rows are read from the database in
+        chunks and written as they are produced, so exports of any size
+        use constant memory under both WSGI and ASGI.
 
-                bank_data['currencies'].append(currency_data)
+        Endpoint
+        --------
+
+        .. http:get:: /domain/export/?output=csv&start=2024-10-01&bank=1,2
+
+        - **output**: ``csv`` (default) or ``ndjson``
+        - **start**, **end**: ISO date or datetime bounds on ``created_at``
+        - **bank**: Comma separated bank ids
+        - **currency**: Comma separated currency short names
+
+        Columns: ``id``, ``created_at``, ``bank``, ``currency``, ``type``,
+        ``value``.
+    """
+    def get(self, request, *args, **kwargs):
+        params = request.GET
+        output = params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return FastJsonResponse({'error': 'Invalid output'}, status=400)
+        try:
+            start = (parse_timestamp(params['start']) if 'start' in params
+                     else None)
+            end = (parse_timestamp(params['end']) if 'end' in params
+                   else None)
+            bank_ids = parse_ids(params.get('bank'))
+        except ValueError:
+            return FastJsonResponse(
+                {'error': 'bank, start and end must be valid'}, status=400)
+        currency_codes = [code.upper()
+                          for code in split_param(params.get('currency'))]
+
+        records = get_export_queryset(start, end, bank_ids, currency_codes)
+        iter_rows, aiter_rows, content_type, extension = (
+            EXPORT_FORMATS[output])
+        # Under ASGI a sync iterator would be collected into memory first;
+        # only WSGI servers provide wsgi.input
+        if 'wsgi.input' not in request.META:
+            rows = aiter_rows(records)
+        else:
+            rows = iter_rows(records)
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="records.{extension}"')
+        return response
+
+
+class AsyncBankCurrencyListView(View):
+    """
+        Native async version of BankCurrencyListView for ASGI workers,
+        served at ``/domain/async/currencies/`` with the same filters. A
+        cached snapshot is answered without leaving the event loop, so a
+        single worker can hold many slow clients; filtered listings are
+        queried in a worker thread.
+    """
+    async def get(self, request, *args, **kwargs):
+        filters, error = get_listing_filters(request)
+        if error:
+            return error
+        if filters is None:
+            return snapshot_response(request, await aget_snapshot())
+        return FastJsonResponse(
+            await sync_to_async(build_bank_currencies)(**filters))
+
+
+class AsyncConvertView(View):
+    """Native async version of ConvertView, ``/domain/async/convert/``."""
+    async def get(self, request, *args, **kwargs):
+        return convert_response(request, await aget_rate_matrix())
+
+
+class AsyncBestRatesView(View):
+    """
+        Native async version of BestRatesView,
+        ``/domain/async/best-rates/``.
+    """
+    async def get(self, request, *args, **kwargs):
+        matrix = await aget_rate_matrix()
+        return FastJsonResponse(matrix.best_rates())
 
-            response_data.append(bank_data)
 
-        return JsonResponse(response_data, safe=False)
+class AsyncHistoryView(View):
+    """
+        Native async version of HistoryView, ``/domain/async/history/``,
+        reading the rollups with the async ORM.
+    """
+    async def get(self, request, *args, **kwargs):
+        params, error = get_history_params(request)
+        if error:
+            return error
+        return FastJsonResponse(history_payload(
+            params, await aget_history(**params)))
+
+
+class RateEventsView(View):
+    """
+        Rate Change Stream
+        ==================
+
+        Server-Sent Events stream pushing every changed rate as it is
+        collected, so clients can keep one connection open instead of
+        polling ``/domain/currencies/``. Requires an ASGI server.
+
+        Endpoint
+        --------
+
+        .. http:get:: /domain/events/
+
+        Each scrape that changes rates sends one ``rates`` event whose
+        data is the list of changes; ``old`` is null for a new rate.
+        A comment line is sent every ``RATE_EVENTS_HEARTBEAT`` seconds
+        to keep idle connections open.
+
+        .. code-block:: text
+
+            id: 42
+            event: rates
+            data: [{"bank": 1, "currency": "USD", "type": "buy",
+                    "old": "128.00", "new": "128.40",
+                    "timestamp": "2024-10-17T09:00:00+00:00"}]
+
+        With the ``cache`` broker a reconnecting client that sends
+        ``Last-Event-ID`` receives the events it missed, at most
+        ``RATE_EVENTS_QUEUE_SIZE`` of them.
+    """
+    async def get(self, request, *args, **kwargs):
+        try:
+            last_id = int(request.headers['Last-Event-ID'])
+        except (KeyError, ValueError):
+            last_id = None
+        if last_id is not None and last_id < 0:
+            # Event ids start at 1, so this cannot be a resumed stream
+            last_id = None
+        subscription = await get_broker().subscribe(last_id)
+        heartbeat = settings.RATE_EVENTS_HEARTBEAT
+
+        async def stream():
+            try:
+                yield f'retry: {int(heartbeat * 1000)}\n\n'
+                while True:
+                    messages = await subscription.get(heartbeat)
+                    if not messages:
+                        yield ': keepalive\n\n'
+                    for event_id, changes in messages:
+                        yield (f'id: {event_id}\nevent: rates\n'
+                               f'data: {dumps(changes).decode()}\n\n')
+            finally:
+                subscription.close()
+
+        response = StreamingHttpResponse(stream(),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop proxies such as nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
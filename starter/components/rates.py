@@ -0,0 +1,26 @@
+# Pre-rendered /domain/currencies/ body, see domain.services.currencies.
+# The snapshot lives in the default cache; point CACHES at a shared backend
+# or set CURRENCIES_SNAPSHOT_FILE when scrapes run in a separate process.
+# Each process also compares its copy with the current data every
+# CURRENCIES_SNAPSHOT_CHECK_INTERVAL seconds (None disables the check), so
+# a per-process cache never serves a snapshot older than that, even after
+# a rebuild_latest_rates or admin edit that did not publish one.
+CURRENCIES_SNAPSHOT_CACHE_TIMEOUT = None
+CURRENCIES_SNAPSHOT_FILE = None
+CURRENCIES_SNAPSHOT_CHECK_INTERVAL = 5
+
+# Synchronous scraper runner, see aggregator.scrapers.runner
+SCRAPER_TIMEOUT = 30
+SCRAPER_POOL_SIZE = 10
+SCRAPER_USER_AGENT = 'Mozilla/5.0 (compatible; exchange-rates-aggregator)'
+
+# Rate change stream, see domain.services.events. 'local' only reaches
+# clients of the process that ran the scrape; use 'cache' with a shared
+# CACHES backend when scrapes and web workers are separate processes.
+# RATE_EVENTS_QUEUE_SIZE also caps how many messages a reconnecting
+# client is replayed.
+RATE_EVENTS_BROKER = 'local'
+RATE_EVENTS_QUEUE_SIZE = 100
+RATE_EVENTS_RETENTION = 300
+RATE_EVENTS_POLL_INTERVAL = 1
+RATE_EVENTS_HEARTBEAT = 15
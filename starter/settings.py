@@ -9,6 +9,7 @@ include(
     'components/base.py',
     'components/secrets.py',
     'components/drf_settings.py',
+    'components/rates.py',
 )
 DEBUG = True
 ALLOWED_HOSTS =['*']